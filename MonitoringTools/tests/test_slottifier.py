@@ -2,11 +2,17 @@ from unittest.mock import NonCallableMock, MagicMock, patch, call
 from slottifier import (
     get_hv_info,
     get_flavor_requirements,
+    get_flavors_by_hosttype,
     get_valid_flavors_for_aggregate,
     convert_to_data_string,
-    calculate_slots_on_hv,
+    FlavorKey,
+    HvKey,
+    _calc_cpu_slots,
+    _calc_gpu_slots,
     get_openstack_resources,
     get_all_hv_info_for_aggregate,
+    group_identical_hvs,
+    sum_slots_on_hvs,
     update_slots,
     get_slottifier_details,
     main,
@@ -52,6 +58,38 @@ def mock_service_fixture():
     }
 
 
+@pytest.fixture(name="mock_compute_services_by_host")
+def mock_service_by_host_fixture(mock_compute_services):
+    """
+    Returns the mock set of services keyed by host, as returned by get_openstack_resources
+    """
+    return {service["host"]: service for service in mock_compute_services.values()}
+
+
+@pytest.fixture(name="mock_hv_info")
+def mock_hv_info_fixture():
+    """fixture for setting up mock hv info, as returned by get_hv_info"""
+
+    def _mock_hv_info(cores_available=0, compute_service_status="enabled", **kwargs):
+        """
+        helper function for setting up mock hv info
+        :param cores_available: cores available to set, used to tell hvs apart
+        :param compute_service_status: status of compute service on hv
+        :param kwargs: other capacity/availability values to set - any not given are 0
+        """
+        return {
+            "cores_available": cores_available,
+            "mem_available": 0,
+            "gpu_capacity": 0,
+            "core_capacity": 0,
+            "mem_capacity": 0,
+            "compute_service_status": compute_service_status,
+            **kwargs,
+        }
+
+    return _mock_hv_info
+
+
 @pytest.fixture(name="mock_aggregate")
 def mock_aggregate_fixture():
     """fixture for setting up a mock aggregate"""
@@ -133,20 +171,15 @@ def test_get_hv_info_negative_results_floored(mock_hypervisors, mock_aggregate):
     }
 
 
-def test_get_hv_info_exists_but_disabled(mock_hypervisors, mock_aggregate):
+def test_get_hv_info_exists_but_disabled(
+    mock_hypervisors, mock_aggregate, mock_hv_info
+):
     """
     tests get_hv_info when hv is disabled - should return default results
     """
     assert get_hv_info(
         mock_hypervisors["hv3"], mock_aggregate(), {"status": "disabled"}
-    ) == {
-        "cores_available": 0,
-        "mem_available": 0,
-        "gpu_capacity": 0,
-        "core_capacity": 0,
-        "mem_capacity": 0,
-        "compute_service_status": "disabled",
-    }
+    ) == mock_hv_info(compute_service_status="disabled")
 
 
 def test_get_flavor_requirements_with_valid_flavor():
@@ -162,9 +195,39 @@ def test_get_flavor_requirements_with_valid_flavor():
         "gpus_required": 2,
         "cores_required": 4,
         "mem_required": 8192,
+        "is_gpu": False,
+    }
+
+
+def test_get_flavor_requirements_with_gpu_flavor():
+    """
+    tests get_flavor_requirements with valid gpu flavor
+    """
+    mock_flavor = {
+        # g- specifies gpu flavor
+        "name": "g-flavor1",
+        "extra_specs": {"accounting:gpu_num": "2"},
+        "vcpus": "4",
+        "ram": "8192",
+    }
+    assert get_flavor_requirements(mock_flavor) == {
+        "gpus_required": 2,
+        "cores_required": 4,
+        "mem_required": 8192,
+        "is_gpu": True,
     }
 
 
+def test_get_flavor_requirements_gpu_no_gpunum():
+    """
+    tests get_flavor_requirements when provided a gpu flavor but gpu_num is not set
+    should not raise error until slots are calculated for it
+    """
+    assert get_flavor_requirements(
+        {"name": "g-flavor1", "vcpus": "4", "ram": "8192"}
+    ) == {"gpus_required": 0, "cores_required": 4, "mem_required": 8192, "is_gpu": True}
+
+
 def test_get_flavor_requirements_with_missing_values():
     """
     tests get_flavor_requirements with all missing values
@@ -184,6 +247,7 @@ def test_get_flavor_requirements_with_partial_values():
         "gpus_required": 0,
         "cores_required": 8,
         "mem_required": 8192,
+        "is_gpu": False,
     }
 
 
@@ -192,7 +256,9 @@ def test_get_valid_flavors_with_matching_type(mock_flavors_list, mock_aggregate)
     test get_valid_flavors_for_aggregate should find all flavors with matching
     aggregate hosttype
     """
-    assert get_valid_flavors_for_aggregate(mock_flavors_list, mock_aggregate("A")) == [
+    assert get_valid_flavors_for_aggregate(
+        get_flavors_by_hosttype(mock_flavors_list), mock_aggregate("A")
+    ) == [
         {"id": 1, "extra_specs": {"aggregate_instance_extra_specs:hosttype": "A"}},
         {"id": 4, "extra_specs": {"aggregate_instance_extra_specs:hosttype": "A"}},
     ]
@@ -202,7 +268,7 @@ def test_get_valid_flavors_with_empty_flavors_list(mock_aggregate):
     """
     test get_valid_flavors_for_aggregate should return empty list if no flavors given
     """
-    assert not get_valid_flavors_for_aggregate([], mock_aggregate("A"))
+    assert not get_valid_flavors_for_aggregate({}, mock_aggregate("A"))
 
 
 def test_get_valid_flavors_with_non_matching_hosttype(
@@ -212,7 +278,9 @@ def test_get_valid_flavors_with_non_matching_hosttype(
     test get_valid_flavors_for_aggregate should return empty list if no flavors found with
     matching aggregate hosttype
     """
-    assert not get_valid_flavors_for_aggregate(mock_flavors_list, mock_aggregate("D"))
+    assert not get_valid_flavors_for_aggregate(
+        get_flavors_by_hosttype(mock_flavors_list), mock_aggregate("D")
+    )
 
 
 def test_get_valid_flavors_with_storagetype(mock_flavors_list, mock_aggregate):
@@ -220,7 +288,8 @@ def test_get_valid_flavors_with_storagetype(mock_flavors_list, mock_aggregate):
     test get_valid_flavors_for_aggregate should return list of hvs with matching hosttype and storagetype
     """
     assert get_valid_flavors_for_aggregate(
-        mock_flavors_list, mock_aggregate(hosttype="C", storagetype="1")
+        get_flavors_by_hosttype(mock_flavors_list),
+        mock_aggregate(hosttype="C", storagetype="1"),
     ) == [
         {
             "id": 5,
@@ -232,6 +301,24 @@ def test_get_valid_flavors_with_storagetype(mock_flavors_list, mock_aggregate):
     ]
 
 
+def test_get_flavors_by_hosttype(mock_flavors_list):
+    """
+    test get_flavors_by_hosttype should group flavors by hosttype and drop flavors without one
+    """
+    res = get_flavors_by_hosttype(mock_flavors_list)
+    assert list(res.keys()) == ["A", "B", "C"]
+    assert [flavor["id"] for flavor in res["A"]] == [1, 4]
+    assert [flavor["id"] for flavor in res["B"]] == [2]
+    assert [flavor["id"] for flavor in res["C"]] == [5, 6]
+
+
+def test_get_flavors_by_hosttype_with_empty_flavors_list():
+    """
+    test get_flavors_by_hosttype should return empty dict if no flavors given
+    """
+    assert not get_flavors_by_hosttype([])
+
+
 def test_convert_to_data_string_no_items():
     """
     Tests convert_to_data_string returns empty string when given empty dict as slots_dict
@@ -285,189 +372,100 @@ def test_convert_to_data_string_multi_item():
     )
 
 
-def test_calculate_slots_on_hv_non_gpu_disabled():
-    """
-    tests calculate_slots_on_hv calculates slots properly for non-gpu flavor
-        - should return 0s since hv is disabled
-    """
-    res = calculate_slots_on_hv(
-        "flavor1",
-        {"cores_required": 10, "mem_required": 10},
-        {
-            "compute_service_status": "disabled",
-            # can fit 10 slots, but should be 0 since compute service disabled
-            "cores_available": 100,
-            "mem_available": 100,
-        },
-    )
-    assert res.slots_available == 0
-    assert res.max_gpu_slots_capacity == 0
-    assert res.estimated_gpu_slots_used == 0
-    assert res.max_gpu_slots_capacity_enabled == 0
+@pytest.fixture(name="mock_hv_key")
+def mock_hv_key_fixture(mock_hv_info):
+    """fixture for setting up mock hv keys, as passed to _calc_cpu_slots/_calc_gpu_slots"""
+    return lambda **kwargs: HvKey(**mock_hv_info(**kwargs))
 
 
-def test_calculate_slots_on_hv_gpu_no_gpunum():
-    """
-    tests calculate_slots_on_hv when provided a gpu flavor but gpus_required is set to 0
-    should raise error
-    """
-    with pytest.raises(RuntimeError):
-        calculate_slots_on_hv(
-            # g- specifies gpu flavor
-            "g-flavor1",
-            {"gpus_required": 0, "cores_required": 10, "mem_required": 10},
+@pytest.mark.parametrize(
+    "hv_info, expected",
+    [
+        # can fit 10 slots, but should be 0 since compute service disabled
+        (
             {
                 "compute_service_status": "disabled",
-                # can fit 10 slots, but should be 0 since compute service disabled
                 "cores_available": 100,
                 "mem_available": 100,
             },
-        )
-
-
-def test_calculate_slots_on_hv_gpu_disabled():
-    """
-    tests calculate_slots_on_hv calculates slots properly for gpu flavor
-        - should return 0s since hv is disabled, but keep track of max gpu slots capacity
-    """
-
-    res = calculate_slots_on_hv(
-        # g- specifies gpu flavor
-        "g-flavor1",
-        {"gpus_required": 1, "cores_required": 10, "mem_required": 10},
-        {
-            "compute_service_status": "disabled",
-            # can fit 10 slots, but should be 0 since compute service disabled
-            "cores_available": 100,
-            "mem_available": 100,
-            "core_capacity": 100,
-            "mem_capacity": 100,
-            "gpu_capacity": 10,
-        },
-    )
-    assert res.slots_available == 0
-    # still want capacity to be updated
-    assert res.max_gpu_slots_capacity == 10
-    assert res.estimated_gpu_slots_used == 0
-    assert res.max_gpu_slots_capacity_enabled == 0
-
-
-def test_calculate_slots_on_hv_mem_available_max():
-    """
-    tests calculate_slots_on_hv calculates slots properly for non-gpu flavor
-    - where memory available is limiting factor
-    """
-
-    res = calculate_slots_on_hv(
-        "flavor1",
-        {"cores_required": 10, "mem_required": 10},
-        {
-            "compute_service_status": "enabled",
-            "cores_available": 100,
-            # can fit only one slot
-            "mem_available": 10,
-        },
-    )
-    assert res.slots_available == 1
-    assert res.max_gpu_slots_capacity == 0
-    assert res.estimated_gpu_slots_used == 0
-    assert res.max_gpu_slots_capacity_enabled == 0
-
-
-def test_calculate_slots_on_hv_cores_available_max():
+            (0, 0, 0, 0),
+        ),
+        # memory available is limiting factor - can fit only one slot
+        ({"cores_available": 100, "mem_available": 10}, (1, 0, 0, 0)),
+        # cores available is limiting factor - can fit 10 slots
+        ({"cores_available": 100, "mem_available": 1000}, (10, 0, 0, 0)),
+    ],
+)
+def test_calc_cpu_slots(mock_hv_key, hv_info, expected):
     """
-    tests calculate_slots_on_hv calculates slots properly for non-gpu flavor
-    - where cores available is limiting factor
+    tests slots are calculated properly for non-gpu flavor
+    - gpu values should always be 0
     """
-    res = calculate_slots_on_hv(
-        "flavor1",
-        {"cores_required": 10, "mem_required": 10},
-        {
-            "compute_service_status": "enabled",
-            # can fit 10 cpu slots
-            "cores_available": 100,
-            "mem_available": 1000,
-        },
+    res = _calc_cpu_slots(
+        FlavorKey(gpus_required=0, cores_required=10, mem_required=10),
+        mock_hv_key(**hv_info),
     )
-    assert res.slots_available == 10
-    assert res.max_gpu_slots_capacity == 0
-    assert res.estimated_gpu_slots_used == 0
-    assert res.max_gpu_slots_capacity_enabled == 0
-
-
-def test_calculate_slots_on_hv_gpu_available_max():
+    assert res == expected
+
+
+@pytest.mark.parametrize(
+    "gpus_required, hv_info, expected",
+    [
+        # should be 0 since compute service disabled, but still want capacity to be updated
+        (1, {"compute_service_status": "disabled", "gpu_capacity": 10}, (0, 0, 10, 0)),
+        # should find only 5 slots available since gpus are the limiting factor
+        (1, {"gpu_capacity": 5}, (5, 0, 5, 5)),
+        # should find 3 slots since we require 2 gpus for each slot
+        (2, {"gpu_capacity": 6}, (3, 0, 3, 3)),
+        # there's 4 flavor slots that could have already been used - so 4 gpu slots are estimated used
+        (
+            1,
+            {
+                "gpu_capacity": 5,
+                "cores_available": 10,
+                "mem_available": 10,
+                "core_capacity": 50,
+                "mem_capacity": 50,
+            },
+            (1, 4, 5, 5),
+        ),
+    ],
+)
+def test_calc_gpu_slots(mock_hv_key, gpus_required, hv_info, expected):
     """
-    tests calculate_slots_on_hv calculates slots properly for gpu flavor
-    - where gpus available is limiting factor
+    tests slots, estimated used gpu slots and max gpu slots are calculated properly for gpu flavor
+    - hv has room for 10 slots unless hv_info says otherwise
     """
-    res = calculate_slots_on_hv(
-        # specifies a gpu flavor
-        "g-flavor1",
-        {"gpus_required": 1, "cores_required": 10, "mem_required": 10},
-        {
-            "compute_service_status": "enabled",
-            # should find only 5 slots available since gpus are the limiting factor
-            "gpu_capacity": 5,
-            "cores_available": 100,
-            "mem_available": 100,
-            "core_capacity": 100,
-            "mem_capacity": 100,
-        },
+    hv_info = {
+        "cores_available": 100,
+        "mem_available": 100,
+        "core_capacity": 100,
+        "mem_capacity": 100,
+        **hv_info,
+    }
+    res = _calc_gpu_slots(
+        FlavorKey(gpus_required=gpus_required, cores_required=10, mem_required=10),
+        mock_hv_key(**hv_info),
     )
-    assert res.slots_available == 5
-    assert res.max_gpu_slots_capacity == 5
-    assert res.estimated_gpu_slots_used == 0
-    assert res.max_gpu_slots_capacity_enabled == 5
+    assert res == expected
 
 
-def test_calculate_slots_on_hv_gpu_max_slots_calculated_properly():
+def test_calc_slots_memoizes_identical_hvs(mock_hv_key):
     """
-    tests calculate_slots_on_hv calculates max slots properly for gpu flavor
+    tests slot calculations reuse previous results for hypervisors with identical info
     """
-    res = calculate_slots_on_hv(
-        # specifies a gpu flavor
-        "g-flavor1",
-        {"gpus_required": 2, "cores_required": 10, "mem_required": 10},
-        {
-            "compute_service_status": "enabled",
-            # should find 3 slots since we require 2 gpus for each slot
-            "gpu_capacity": 6,
-            "cores_available": 100,
-            "mem_available": 100,
-            "core_capacity": 100,
-            "mem_capacity": 100,
-        },
+    _calc_cpu_slots.cache_clear()
+    flavor_key = FlavorKey(cores_required=10, mem_required=10, gpus_required=0)
+    fst = _calc_cpu_slots(
+        flavor_key, mock_hv_key(cores_available=100, mem_available=100)
     )
-    assert res.slots_available == 3
-    assert res.max_gpu_slots_capacity == 3
-    assert res.estimated_gpu_slots_used == 0
-    assert res.max_gpu_slots_capacity_enabled == 3
-
-
-def test_calculate_slots_on_hv_calculates_used_gpu_capacity():
-    """
-    tests calculate_slots_on_hv calculates slots properly for gpu flavor
-    - should calculate estimated used gpus slots properly
-    """
-    res = calculate_slots_on_hv(
-        # specifies a gpu flavor
-        "g-flavor1",
-        {"gpus_required": 1, "cores_required": 10, "mem_required": 10},
-        {
-            "compute_service_status": "enabled",
-            # should find only 5 slots available since gpus are the limiting factor
-            "gpu_capacity": 5,
-            "cores_available": 10,
-            "mem_available": 10,
-            # there's 4 flavor slots that could have already been used
-            "core_capacity": 50,
-            "mem_capacity": 50,
-        },
+    snd = _calc_cpu_slots(
+        flavor_key, mock_hv_key(cores_available=100, mem_available=100)
     )
-    assert res.slots_available == 1
-    assert res.max_gpu_slots_capacity == 5
-    assert res.estimated_gpu_slots_used == 4
-    assert res.max_gpu_slots_capacity_enabled == 5
+    assert fst == snd == (10, 0, 0, 0)
+    # pylint: disable=no-value-for-parameter
+    assert _calc_cpu_slots.cache_info().hits == 1
+    assert _calc_cpu_slots.cache_info().misses == 1
 
 
 @patch("slottifier.openstack")
@@ -480,29 +478,34 @@ def test_get_openstack_resources(mock_openstack):
 
     mock_conn.list_hypervisors.return_value = [{"name": "hv1", "id": 1}]
     mock_conn.compute.aggregates.return_value = [{"name": "ag1", "id": 2}]
-    mock_conn.compute.services.return_value = [{"name": "svc1", "id": 3}]
+    mock_conn.compute.services.return_value = [{"name": "svc1", "id": 3, "host": "hv1"}]
     mock_conn.compute.flavors.return_value = [{"name": "flv1", "id": 4}]
 
     mock_instance = NonCallableMock()
     res = get_openstack_resources(mock_instance)
 
     mock_openstack.connect.assert_called_once_with(cloud=mock_instance)
-    mock_conn.compute.services.assert_called_once()
+    mock_conn.compute.services.assert_called_once_with(binary="nova-compute")
     mock_conn.compute.aggregates.assert_called_once()
     mock_conn.list_hypervisors.assert_called_once()
     mock_conn.compute.flavors.assert_called_once_with(get_extra_specs=True)
 
     assert res == {
-        "compute_services": [{"name": "svc1", "id": 3}],
-        "aggregates": [{"name": "ag1", "id": 2}],
-        "hypervisors": [{"name": "hv1", "id": 1}],
-        "flavors": [{"name": "flv1", "id": 4}],
+        "compute_services": {3: {"name": "svc1", "id": 3, "host": "hv1"}},
+        "aggregates": {2: {"name": "ag1", "id": 2}},
+        "hypervisors": {1: {"name": "hv1", "id": 1}},
+        "flavors": {4: {"name": "flv1", "id": 4}},
+        "compute_services_by_host": {"hv1": {"name": "svc1", "id": 3, "host": "hv1"}},
+        "hypervisors_by_name": {"hv1": {"name": "hv1", "id": 1}},
     }
 
 
 @patch("slottifier.get_hv_info")
 def test_get_all_hv_info_for_aggregate_with_valid_data(
-    mock_get_hv_info, mock_hypervisors, mock_compute_services
+    mock_get_hv_info,
+    mock_hypervisors,
+    mock_compute_services,
+    mock_compute_services_by_host,
 ):
     """
     Tests get_all_hv_info_for_aggregate with valid data.
@@ -511,7 +514,7 @@ def test_get_all_hv_info_for_aggregate_with_valid_data(
     """
     mock_aggregate = {"hosts": ["hv1", "hv2"]}
     res = get_all_hv_info_for_aggregate(
-        mock_aggregate, mock_compute_services.values(), mock_hypervisors.values()
+        mock_aggregate, mock_compute_services_by_host, mock_hypervisors
     )
     mock_get_hv_info.assert_has_calls(
         [
@@ -529,7 +532,7 @@ def test_get_all_hv_info_for_aggregate_with_valid_data(
 
 
 def test_get_all_hv_info_for_aggregate_with_invalid_data(
-    mock_hypervisors, mock_compute_services
+    mock_hypervisors, mock_compute_services_by_host
 ):
     """
     Tests get_all_hv_info_for_aggregate with invalid data.
@@ -545,13 +548,39 @@ def test_get_all_hv_info_for_aggregate_with_invalid_data(
     }
     assert not (
         get_all_hv_info_for_aggregate(
-            mock_aggregate, mock_compute_services.values(), mock_hypervisors.values()
+            mock_aggregate, mock_compute_services_by_host, mock_hypervisors
         )
     )
 
 
+@patch("slottifier.get_hv_info")
+def test_get_all_hv_info_for_aggregate_with_disabled_hv(mock_get_hv_info):
+    """
+    Tests get_all_hv_info_for_aggregate with a disabled hv.
+    should skip the disabled hv without getting its info
+    """
+    mock_aggregate = {"hosts": ["hv1", "hv3"]}
+    mock_compute_services_by_host = {
+        "hv1": {"host": "hv1", "name": "svc1"},
+        "hv3": {"host": "hv3", "name": "svc3"},
+    }
+    mock_hypervisors_by_name = {
+        "hv1": {"name": "hv1", "status": "enabled"},
+        "hv3": {"name": "hv3", "status": "disabled"},
+    }
+    res = get_all_hv_info_for_aggregate(
+        mock_aggregate, mock_compute_services_by_host, mock_hypervisors_by_name
+    )
+    mock_get_hv_info.assert_called_once_with(
+        mock_hypervisors_by_name["hv1"],
+        mock_aggregate,
+        mock_compute_services_by_host["hv1"],
+    )
+    assert res == [mock_get_hv_info.return_value]
+
+
 def test_get_all_hv_info_for_aggregate_with_empty_aggregate(
-    mock_hypervisors, mock_compute_services
+    mock_hypervisors, mock_compute_services_by_host
 ):
     """
     Tests get_all_hv_info_for_aggregate with aggregate with no hosts.
@@ -560,93 +589,302 @@ def test_get_all_hv_info_for_aggregate_with_empty_aggregate(
     mock_aggregate = {"hosts": []}
     assert not (
         get_all_hv_info_for_aggregate(
-            mock_aggregate, mock_hypervisors.values(), mock_compute_services.values()
+            mock_aggregate, mock_compute_services_by_host, mock_hypervisors
         )
     )
 
 
-@patch("slottifier.get_flavor_requirements")
-@patch("slottifier.calculate_slots_on_hv")
+def test_group_identical_hvs_with_unique_hvs(mock_hv_info):
+    """
+    Tests group_identical_hvs with hvs that all differ.
+    should return each hv once
+    """
+    mock_host_1 = mock_hv_info(cores_available=1)
+    mock_host_2 = mock_hv_info(cores_available=2)
+    assert group_identical_hvs([mock_host_1, mock_host_2]) == [
+        (HvKey(**mock_host_1), 1),
+        (HvKey(**mock_host_2), 1),
+    ]
+
+
+def test_group_identical_hvs_with_identical_hvs(mock_hv_info):
+    """
+    Tests group_identical_hvs with some identical hvs.
+    should return one entry for identical hvs along with how many there are
+    """
+    mock_host_1 = mock_hv_info(cores_available=1)
+    mock_host_2 = mock_hv_info(cores_available=2)
+    assert group_identical_hvs(
+        [mock_host_1, mock_host_2, mock_hv_info(cores_available=1)]
+    ) == [(HvKey(**mock_host_1), 2), (HvKey(**mock_host_2), 1)]
+
+
+def test_group_identical_hvs_with_no_hvs():
+    """
+    Tests group_identical_hvs with no hvs.
+    should return empty list
+    """
+    assert not group_identical_hvs([])
+
+
+def test_sum_slots_on_hvs():
+    """
+    Tests sum_slots_on_hvs with groups of identical hvs.
+    should multiply each hv's slots by the size of its group and total each field separately
+    """
+    mock_calc_slots = MagicMock()
+    mock_calc_slots.side_effect = [(1, 2, 3, 4), (10, 20, 30, 40)]
+    mock_flavor_key = NonCallableMock()
+    mock_hv_1 = NonCallableMock()
+    mock_hv_2 = NonCallableMock()
+    res = sum_slots_on_hvs(
+        mock_calc_slots, mock_flavor_key, [(mock_hv_1, 2), (mock_hv_2, 1)]
+    )
+    assert mock_calc_slots.call_args_list == [
+        call(mock_flavor_key, mock_hv_1),
+        call(mock_flavor_key, mock_hv_2),
+    ]
+    assert res == SlottifierEntry(
+        slots_available=12,
+        estimated_gpu_slots_used=24,
+        max_gpu_slots_capacity=36,
+        max_gpu_slots_capacity_enabled=48,
+    )
+
+
+def test_sum_slots_on_hvs_with_no_hvs():
+    """
+    Tests sum_slots_on_hvs with no hvs.
+    should return an empty SlottifierEntry
+    """
+    assert sum_slots_on_hvs(MagicMock(), NonCallableMock(), []) == SlottifierEntry()
+
+
+@pytest.fixture(name="mock_flavor_reqs")
+def mock_flavor_reqs_fixture():
+    """
+    Returns a function that returns mock flavor requirements
+    """
+
+    def _mock_flavor_reqs(cores_required=1, is_gpu=False):
+        """
+        helper function for setting up mock flavor requirements
+        :param cores_required: cores required to set, used to tell flavors apart
+        :param is_gpu: whether flavor is a gpu flavor
+        """
+        return {
+            "cores_required": cores_required,
+            "mem_required": 1,
+            "gpus_required": 1 if is_gpu else 0,
+            "is_gpu": is_gpu,
+        }
+
+    return _mock_flavor_reqs
+
+
+@patch("slottifier._calc_cpu_slots")
 def test_update_slots_one_flavor_one_hv(
-    mock_calculate_slots_on_hv, mock_get_flavor_requirements
+    mock_calc_cpu_slots, mock_hv_info, mock_flavor_reqs
 ):
     """
     Tests update_slots with one flavor and one hv.
-    should call calculate_slots_on_hv once with the given flavor and hv
+    should calculate slots once with the given flavor and hv
     """
     mock_flavor = {"name": "flv1"}
-    mock_host = NonCallableMock()
+    mock_host = mock_hv_info()
 
-    slots_dict = {"flv1": 1}
-    mock_calculate_slots_on_hv.return_value = 1
-    res = update_slots([mock_flavor], [mock_host], slots_dict=slots_dict)
-    mock_get_flavor_requirements.assert_called_once_with(mock_flavor)
-    mock_calculate_slots_on_hv.assert_called_once_with(
-        "flv1", mock_get_flavor_requirements.return_value, mock_host
+    slots_dict = {"flv1": SlottifierEntry(1, 1, 1, 1)}
+    mock_calc_cpu_slots.return_value = (1, 0, 0, 0)
+    res = update_slots(
+        [mock_flavor],
+        [mock_host],
+        slots_dict=slots_dict,
+        flavor_reqs_by_name={"flv1": mock_flavor_reqs()},
+    )
+    mock_calc_cpu_slots.assert_called_once_with(
+        FlavorKey(cores_required=1, mem_required=1, gpus_required=0),
+        HvKey(**mock_host),
     )
-    assert res == {"flv1": 2}
+    assert res == {"flv1": SlottifierEntry(2, 1, 1, 1)}
 
 
-@patch("slottifier.get_flavor_requirements")
-@patch("slottifier.calculate_slots_on_hv")
+@patch("slottifier._calc_cpu_slots")
 def test_update_slots_one_flavor_multi_hv(
-    mock_calculate_slots_on_hv, mock_get_flavor_requirements
+    mock_calc_cpu_slots, mock_hv_info, mock_flavor_reqs
 ):
     """
     Tests update_slots with one flavor and multiple hvs.
-    should call calculate_slots_on_hv on each hv with the same flavor
+    should calculate slots on each hv with the same flavor
     """
     mock_flavor = {"name": "flv1"}
-    mock_host_1 = NonCallableMock()
-    mock_host_2 = NonCallableMock()
-    slots_dict = {"flv1": 1}
-    mock_calculate_slots_on_hv.side_effect = [1, 2]
-    res = update_slots([mock_flavor], [mock_host_1, mock_host_2], slots_dict=slots_dict)
-    mock_get_flavor_requirements.assert_called_once_with(mock_flavor)
-    mock_calculate_slots_on_hv.assert_has_calls(
+    mock_flavor_key = FlavorKey(cores_required=1, mem_required=1, gpus_required=0)
+    mock_host_1 = mock_hv_info(cores_available=1)
+    mock_host_2 = mock_hv_info(cores_available=2)
+    slots_dict = {"flv1": SlottifierEntry(slots_available=1)}
+    mock_calc_cpu_slots.side_effect = [(1, 0, 0, 0), (2, 0, 0, 0)]
+    res = update_slots(
+        [mock_flavor],
+        [mock_host_1, mock_host_2],
+        slots_dict=slots_dict,
+        flavor_reqs_by_name={"flv1": mock_flavor_reqs()},
+    )
+    mock_calc_cpu_slots.assert_has_calls(
         [
-            call("flv1", mock_get_flavor_requirements.return_value, mock_host_1),
-            call("flv1", mock_get_flavor_requirements.return_value, mock_host_2),
+            call(mock_flavor_key, HvKey(**mock_host_1)),
+            call(mock_flavor_key, HvKey(**mock_host_2)),
         ]
     )
-    assert res == {"flv1": 4}
+    assert res == {"flv1": SlottifierEntry(slots_available=4)}
 
 
-@patch("slottifier.get_flavor_requirements")
-@patch("slottifier.calculate_slots_on_hv")
+@patch("slottifier._calc_cpu_slots")
 def test_update_slots_multi_flavor_multi_hv(
-    mock_calculate_slots_on_hv, mock_get_flavor_requirements
+    mock_calc_cpu_slots, mock_hv_info, mock_flavor_reqs
 ):
     """
     Tests update_slots with multiple flavors and multiple hvs.
-    should call calculate_slots_on_hv with each unique hv-flavor pairings
+    should calculate slots for each unique hv-flavor pairings
     """
     mock_flavor_1 = {"name": "flv1"}
     mock_flavor_2 = {"name": "flv2"}
-    mock_host_1 = NonCallableMock()
-    mock_host_2 = NonCallableMock()
-    slots_dict = {"flv1": 1, "flv2": 0}
-    mock_calculate_slots_on_hv.side_effect = [1, 2, 0, 0]
+    mock_flavor_key_1 = FlavorKey(cores_required=1, mem_required=1, gpus_required=0)
+    mock_flavor_key_2 = FlavorKey(cores_required=2, mem_required=1, gpus_required=0)
+    mock_host_1 = mock_hv_info(cores_available=1)
+    mock_host_2 = mock_hv_info(cores_available=2)
+    slots_dict = {
+        "flv1": SlottifierEntry(slots_available=1),
+        "flv2": SlottifierEntry(),
+    }
+    mock_calc_cpu_slots.side_effect = [
+        (1, 0, 0, 0),
+        (2, 0, 0, 0),
+        (0, 0, 0, 0),
+        (0, 0, 0, 0),
+    ]
     res = update_slots(
         [mock_flavor_1, mock_flavor_2],
         [mock_host_1, mock_host_2],
         slots_dict=slots_dict,
+        flavor_reqs_by_name={
+            "flv1": mock_flavor_reqs(),
+            "flv2": mock_flavor_reqs(cores_required=2),
+        },
     )
-    mock_get_flavor_requirements.assert_has_calls(
-        [call(mock_flavor_1), call(mock_flavor_2)]
-    )
-    mock_calculate_slots_on_hv.assert_has_calls(
+    mock_calc_cpu_slots.assert_has_calls(
         [
-            call("flv1", mock_get_flavor_requirements.return_value, mock_host_1),
-            call("flv1", mock_get_flavor_requirements.return_value, mock_host_2),
-            call("flv2", mock_get_flavor_requirements.return_value, mock_host_1),
-            call("flv2", mock_get_flavor_requirements.return_value, mock_host_2),
+            call(mock_flavor_key_1, HvKey(**mock_host_1)),
+            call(mock_flavor_key_1, HvKey(**mock_host_2)),
+            call(mock_flavor_key_2, HvKey(**mock_host_1)),
+            call(mock_flavor_key_2, HvKey(**mock_host_2)),
         ]
     )
-    assert res == {"flv1": 4, "flv2": 0}
+    assert res == {
+        "flv1": SlottifierEntry(slots_available=4),
+        "flv2": SlottifierEntry(),
+    }
+
+
+@patch("slottifier._calc_cpu_slots")
+def test_update_slots_one_flavor_identical_hvs(
+    mock_calc_cpu_slots, mock_hv_info, mock_flavor_reqs
+):
+    """
+    Tests update_slots with one flavor and multiple identical hvs.
+    should calculate slots once and count the result for each hv
+    """
+    mock_flavor = {"name": "flv1"}
+    mock_host_1 = mock_hv_info()
+    mock_host_2 = mock_hv_info()
+    slots_dict = {"flv1": SlottifierEntry(slots_available=1)}
+    mock_calc_cpu_slots.return_value = (2, 0, 0, 0)
+    res = update_slots(
+        [mock_flavor],
+        [mock_host_1, mock_host_2],
+        slots_dict=slots_dict,
+        flavor_reqs_by_name={"flv1": mock_flavor_reqs()},
+    )
+    mock_calc_cpu_slots.assert_called_once_with(
+        FlavorKey(cores_required=1, mem_required=1, gpus_required=0),
+        HvKey(**mock_host_1),
+    )
+    assert res == {"flv1": SlottifierEntry(slots_available=5)}
+
+
+@patch("slottifier._calc_gpu_slots")
+@patch("slottifier._calc_cpu_slots")
+def test_update_slots_skips_disabled_hvs_for_non_gpu_flavors(
+    mock_calc_cpu_slots, mock_calc_gpu_slots, mock_hv_info, mock_flavor_reqs
+):
+    """
+    Tests update_slots with hvs which have their compute service disabled.
+    should only calculate slots on disabled hvs for gpu flavors
+    """
+    mock_flavor = {"name": "flv1"}
+    mock_gpu_flavor = {"name": "g-flv1"}
+    mock_enabled_host = mock_hv_info(cores_available=1)
+    mock_disabled_host = mock_hv_info(
+        cores_available=2, compute_service_status="disabled"
+    )
+    slots_dict = {"flv1": SlottifierEntry(), "g-flv1": SlottifierEntry()}
+    mock_calc_cpu_slots.return_value = (1, 0, 0, 0)
+    mock_calc_gpu_slots.return_value = (1, 1, 1, 1)
+    res = update_slots(
+        [mock_flavor, mock_gpu_flavor],
+        [mock_enabled_host, mock_disabled_host],
+        slots_dict=slots_dict,
+        flavor_reqs_by_name={
+            "flv1": mock_flavor_reqs(),
+            "g-flv1": mock_flavor_reqs(is_gpu=True),
+        },
+    )
+    mock_gpu_flavor_key = FlavorKey(cores_required=1, mem_required=1, gpus_required=1)
+    mock_calc_cpu_slots.assert_called_once_with(
+        FlavorKey(cores_required=1, mem_required=1, gpus_required=0),
+        HvKey(**mock_enabled_host),
+    )
+    assert mock_calc_gpu_slots.call_args_list == [
+        call(mock_gpu_flavor_key, HvKey(**mock_enabled_host)),
+        call(mock_gpu_flavor_key, HvKey(**mock_disabled_host)),
+    ]
+    assert res == {
+        "flv1": SlottifierEntry(slots_available=1),
+        "g-flv1": SlottifierEntry(2, 2, 2, 2),
+    }
+
+
+def test_update_slots_gpu_flavor_no_gpunum(mock_hv_info, mock_flavor_reqs):
+    """
+    Tests update_slots with a gpu flavor that has no gpu_num set.
+    should raise error if there are hvs to calculate slots on
+    """
+    flavor_reqs = {**mock_flavor_reqs(is_gpu=True), "gpus_required": 0}
+    with pytest.raises(RuntimeError):
+        update_slots(
+            [{"name": "g-flv1"}],
+            [mock_hv_info()],
+            slots_dict={"g-flv1": SlottifierEntry()},
+            flavor_reqs_by_name={"g-flv1": flavor_reqs},
+        )
+
+
+def test_update_slots_gpu_flavor_no_gpunum_no_hvs(mock_flavor_reqs):
+    """
+    Tests update_slots with a gpu flavor that has no gpu_num set, but no hvs.
+    should not raise error and leave slots as they are
+    """
+    flavor_reqs = {**mock_flavor_reqs(is_gpu=True), "gpus_required": 0}
+    res = update_slots(
+        [{"name": "g-flv1"}],
+        [],
+        slots_dict={"g-flv1": SlottifierEntry()},
+        flavor_reqs_by_name={"g-flv1": flavor_reqs},
+    )
+    assert res == {"g-flv1": SlottifierEntry()}
 
 
 @patch("slottifier.get_openstack_resources")
+@patch("slottifier.get_flavors_by_hosttype")
+@patch("slottifier.get_flavor_requirements")
 @patch("slottifier.get_valid_flavors_for_aggregate")
 @patch("slottifier.get_all_hv_info_for_aggregate")
 @patch("slottifier.update_slots")
@@ -656,33 +894,49 @@ def test_get_slottifier_details_one_aggregate(
     mock_update_slots,
     mock_get_all_hv_info_for_aggregate,
     mock_get_valid_flavors_for_aggregate,
+    mock_get_flavor_requirements,
+    mock_get_flavors_by_hosttype,
     mock_get_openstack_resources,
 ):
     """
     Tests get_slottifier_details with one aggregate.
     """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
     mock_instance = NonCallableMock()
-    mock_flavors = [{"name": "flv1"}, {"name": "flv2"}]
-    mock_compute_services = NonCallableMock()
-    mock_hypervisors = NonCallableMock()
+    mock_flavors = {1: {"name": "flv1"}, 2: {"name": "flv2"}}
+    mock_compute_services_by_host = NonCallableMock()
+    mock_hypervisors_by_name = NonCallableMock()
 
     mock_get_openstack_resources.return_value = {
-        "aggregates": ["ag1"],
+        "aggregates": {3: "ag1"},
         "flavors": mock_flavors,
-        "compute_services": mock_compute_services,
-        "hypervisors": mock_hypervisors,
+        "compute_services_by_host": mock_compute_services_by_host,
+        "hypervisors_by_name": mock_hypervisors_by_name,
     }
+    mock_get_flavors_by_hosttype.return_value = {"A": list(mock_flavors.values())}
+    mock_get_valid_flavors_for_aggregate.return_value = list(mock_flavors.values())
     res = get_slottifier_details(mock_instance)
     mock_get_openstack_resources.assert_called_once_with(mock_instance)
-    mock_get_valid_flavors_for_aggregate.assert_called_once_with(mock_flavors, "ag1")
+    (flavors_arg,) = mock_get_flavors_by_hosttype.call_args.args
+    assert list(flavors_arg) == list(mock_flavors.values())
+    mock_get_flavor_requirements.assert_has_calls(
+        [call({"name": "flv1"}), call({"name": "flv2"})]
+    )
+    mock_get_valid_flavors_for_aggregate.assert_called_once_with(
+        mock_get_flavors_by_hosttype.return_value, "ag1"
+    )
     mock_get_all_hv_info_for_aggregate.assert_called_once_with(
-        "ag1", mock_compute_services, mock_hypervisors
+        "ag1", mock_compute_services_by_host, mock_hypervisors_by_name
     )
 
     mock_update_slots.assert_called_once_with(
         mock_get_valid_flavors_for_aggregate.return_value,
         mock_get_all_hv_info_for_aggregate.return_value,
         {"flv1": SlottifierEntry(), "flv2": SlottifierEntry()},
+        {
+            "flv1": mock_get_flavor_requirements.return_value,
+            "flv2": mock_get_flavor_requirements.return_value,
+        },
     )
 
     mock_convert_to_data_string.assert_called_once_with(
@@ -691,6 +945,40 @@ def test_get_slottifier_details_one_aggregate(
     assert res == mock_convert_to_data_string.return_value
 
 
+@pytest.mark.parametrize(
+    "aggregate",
+    [
+        # flavor matches no aggregate
+        {"metadata": {"hosttype": "B"}, "hosts": []},
+        # aggregate has no valid hvs - hv1 has no compute service or hypervisor
+        {"metadata": {"hosttype": "A"}, "hosts": ["hv1"]},
+    ],
+)
+@patch("slottifier.get_openstack_resources")
+def test_get_slottifier_details_gpu_flavor_no_gpunum_no_hvs(
+    mock_get_openstack_resources, aggregate
+):
+    """
+    Tests get_slottifier_details with a misconfigured gpu flavor that has no hvs to be built on.
+    should not fail the scrape, and report no slots for the flavor
+    """
+    mock_get_openstack_resources.return_value = {
+        "aggregates": {1: aggregate},
+        "flavors": {
+            2: {
+                "name": "g-flv1",
+                "vcpus": 1,
+                "ram": 1,
+                "extra_specs": {"aggregate_instance_extra_specs:hosttype": "A"},
+            }
+        },
+        "compute_services_by_host": {},
+        "hypervisors_by_name": {},
+    }
+    res = get_slottifier_details("prod")
+    assert "flavor=g-flv1 SlotsAvailable=0i" in res
+
+
 @patch("slottifier.run_scrape")
 @patch("slottifier.parse_args")
 def test_main(mock_parse_args, mock_run_scrape):
@@ -1,5 +1,7 @@
 import sys
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Tuple, NamedTuple, Iterable, Callable
 import openstack
 from slottifier_entry import SlottifierEntry
 from send_metric_utils import parse_args, run_scrape
@@ -41,7 +43,7 @@ def get_flavor_requirements(flavor: Dict) -> Dict:
     """
     Helper function to get flavor memory/ram/gpu requirements for a VM of that type to be built on a hv
     :param flavor: flavor to get requirements from
-    :return: dictionary of requirements
+    :return: dictionary of requirements and whether the flavor is a gpu flavor
     """
     try:
         flavor_reqs = {
@@ -59,16 +61,31 @@ def get_flavor_requirements(flavor: Dict) -> Dict:
             "gpus_required": int(
                 flavor.get("extra_specs", {}).get("accounting:gpu_num", 0)
             ),
+            "is_gpu": "g-" in flavor.get("name", ""),
         }
     )
     return flavor_reqs
 
 
-def get_valid_flavors_for_aggregate(flavor_list: List, aggregate: Dict) -> List:
+def get_flavors_by_hosttype(flavor_list: Iterable) -> Dict[str, List]:
     """
-    Helper function that filters a list of flavors
-    to find those that can be built on a hv belonging to a given aggregate
-    :param flavor_list: a list of flavors to check
+    Helper function that groups a list of flavors by the aggregate hosttype they can be built on
+    flavors without a hosttype are dropped since they can't be matched to any aggregate
+    :param flavor_list: a list of flavors to group
+    :return: a dictionary of hosttype to list of flavors for that hosttype
+    """
+    flavors_by_hosttype = {}
+    for flavor in flavor_list:
+        hosttype = flavor["extra_specs"].get("aggregate_instance_extra_specs:hosttype")
+        if hosttype:
+            flavors_by_hosttype.setdefault(hosttype, []).append(flavor)
+    return flavors_by_hosttype
+
+
+def get_valid_flavors_for_aggregate(flavors_by_hosttype: Dict, aggregate: Dict) -> List:
+    """
+    Helper function that finds the flavors that can be built on a hv belonging to a given aggregate
+    :param flavors_by_hosttype: a dictionary of hosttype to list of flavors, as returned by get_flavors_by_hosttype
     :param aggregate: specifies the aggregate to find compatible flavors for
     :return: a list of valid flavors for hosttype
     """
@@ -79,19 +96,7 @@ def get_valid_flavors_for_aggregate(flavor_list: List, aggregate: Dict) -> List:
     if not hypervisor_hosttype:
         return valid_flavors
 
-    for flavor in flavor_list:
-        # validate that flavor can be used on host aggregate
-        if (
-            "aggregate_instance_extra_specs:hosttype"
-            not in flavor["extra_specs"].keys()
-        ):
-            continue
-        if (
-            flavor["extra_specs"]["aggregate_instance_extra_specs:hosttype"]
-            != hypervisor_hosttype
-        ):
-            continue
-
+    for flavor in flavors_by_hosttype.get(hypervisor_hosttype, []):
         has_local_storage = (
             "aggregate_instance_extra_specs:local-storage-type"
             in flavor["extra_specs"].keys()
@@ -117,79 +122,109 @@ def convert_to_data_string(instance: str, slots_dict: Dict) -> str:
     :param instance: which cloud the info was scraped from (prod or dev)
     :return: a comma-separated string of key=value taken from input dictionary
     """
-    data_string = ""
-    for flavor, slot_info in slots_dict.items():
-        data_string += (
-            f"SlotsAvailable,instance={instance.capitalize()},flavor={flavor}"
-            f" SlotsAvailable={slot_info.slots_available}i"
-            f",maxSlotsAvailable={slot_info.max_gpu_slots_capacity}i"
-            f",usedSlots={slot_info.estimated_gpu_slots_used}i"
-            f",enabledSlots={slot_info.max_gpu_slots_capacity_enabled}i\n"
-        )
-    return data_string
+    instance = instance.capitalize()
+    return "".join(
+        f"SlotsAvailable,instance={instance},flavor={flavor}"
+        f" SlotsAvailable={slot_info.slots_available}i"
+        f",maxSlotsAvailable={slot_info.max_gpu_slots_capacity}i"
+        f",usedSlots={slot_info.estimated_gpu_slots_used}i"
+        f",enabledSlots={slot_info.max_gpu_slots_capacity_enabled}i\n"
+        for flavor, slot_info in slots_dict.items()
+    )
 
 
-def calculate_slots_on_hv(
-    flavor_name: str, flavor_reqs: Dict, hv_info: Dict
-) -> SlottifierEntry:
+class FlavorKey(NamedTuple):
     """
-    Helper function that calculates available slots for a flavor on a given hypervisor
-    :param flavor_name: name of flavor
-    :param flavor_reqs: dictionary of memory, cpu, and gpu requirements of flavor
-    :param hv_info: dictionary of memory, cpu, and gpu capacity/availability on hypervisor
-        and whether hv compute service is enabled
-    :return: A dataclass holding slottifer information to update with
+    Hashable flavor requirements used to memoize slot calculations
     """
-    slots_dataclass = SlottifierEntry()
+
+    cores_required: int
+    mem_required: int
+    gpus_required: int
+
+
+class HvKey(NamedTuple):
+    """
+    Hashable hypervisor capacity/availability used to memoize slot calculations
+    """
+
+    cores_available: int
+    mem_available: int
+    gpu_capacity: int
+    core_capacity: int
+    mem_capacity: int
+    compute_service_status: str
+
+
+@lru_cache(maxsize=None)
+def _calc_cpu_slots(flavor: FlavorKey, hv: HvKey) -> Tuple[int, int, int, int]:
+    """
+    Helper function that calculates available slots for a non-gpu flavor on a given hypervisor.
+    Many hypervisors share the same capacity/availability, so results are memoized
+    :param flavor: requirements of flavor
+    :param hv: capacity/availability of hypervisor
+    :return: tuple of (slots_available, estimated_gpu_slots_used, max_gpu_slots_capacity,
+        max_gpu_slots_capacity_enabled) - gpu values are always 0
+    """
+    if hv.compute_service_status != "enabled":
+        return 0, 0, 0, 0
 
     slots_available = min(
-        hv_info["cores_available"] // flavor_reqs["cores_required"],
-        hv_info["mem_available"] // flavor_reqs["mem_required"],
+        hv.cores_available // flavor.cores_required,
+        hv.mem_available // flavor.mem_required,
     )
+    return slots_available, 0, 0, 0
 
-    if "g-" in flavor_name:
-        # workaround for bugs where gpu number not specified
-        if flavor_reqs["gpus_required"] == 0:
-            raise RuntimeError(
-                f"gpu flavor {flavor_name} does not have 'gpunum' metadata"
-            )
-
-        theoretical_gpu_slots_available = min(
-            hv_info["gpu_capacity"] // flavor_reqs["gpus_required"],
-            hv_info["core_capacity"] // flavor_reqs["cores_required"],
-            hv_info["mem_capacity"] // flavor_reqs["mem_required"],
-        )
 
-        estimated_slots_used = (
-            min(
-                hv_info["core_capacity"] // flavor_reqs["cores_required"],
-                hv_info["mem_capacity"] // flavor_reqs["mem_required"],
-            )
-            - slots_available
-        )
-
-        # estimated number of GPU slots used - based off of how much cpu/mem is currently being used
-        # assumes that all VMs on the HV contains only this flavor -  which may not be true
-        # if slots used is greater than gpu slots available we assume all gpus are being used
-        slots_dataclass.estimated_gpu_slots_used = min(
-            theoretical_gpu_slots_available, estimated_slots_used
-        )
+@lru_cache(maxsize=None)
+def _calc_gpu_slots(flavor: FlavorKey, hv: HvKey) -> Tuple[int, int, int, int]:
+    """
+    Helper function that calculates available slots for a gpu flavor on a given hypervisor.
+    Many hypervisors share the same capacity/availability, so results are memoized
+    :param flavor: requirements of flavor
+    :param hv: capacity/availability of hypervisor
+    :return: tuple of (slots_available, estimated_gpu_slots_used, max_gpu_slots_capacity,
+        max_gpu_slots_capacity_enabled)
+    """
+    is_enabled = hv.compute_service_status == "enabled"
 
-        slots_dataclass.max_gpu_slots_capacity = theoretical_gpu_slots_available
+    slots_available = min(
+        hv.cores_available // flavor.cores_required,
+        hv.mem_available // flavor.mem_required,
+    )
 
-        if hv_info["compute_service_status"] == "enabled":
-            slots_dataclass.max_gpu_slots_capacity_enabled = (
-                theoretical_gpu_slots_available
-            )
+    theoretical_gpu_slots_available = min(
+        hv.gpu_capacity // flavor.gpus_required,
+        hv.core_capacity // flavor.cores_required,
+        hv.mem_capacity // flavor.mem_required,
+    )
 
-        slots_available = min(
-            slots_available,
-            theoretical_gpu_slots_available - slots_dataclass.estimated_gpu_slots_used,
+    estimated_slots_used = (
+        min(
+            hv.core_capacity // flavor.cores_required,
+            hv.mem_capacity // flavor.mem_required,
         )
+        - slots_available
+    )
 
-    if hv_info["compute_service_status"] == "enabled":
-        slots_dataclass.slots_available = slots_available
-    return slots_dataclass
+    # estimated number of GPU slots used - based off of how much cpu/mem is currently being used
+    # assumes that all VMs on the HV contains only this flavor -  which may not be true
+    # if slots used is greater than gpu slots available we assume all gpus are being used
+    estimated_gpu_slots_used = min(
+        theoretical_gpu_slots_available, estimated_slots_used
+    )
+
+    slots_available = min(
+        slots_available,
+        theoretical_gpu_slots_available - estimated_gpu_slots_used,
+    )
+
+    return (
+        slots_available if is_enabled else 0,
+        estimated_gpu_slots_used,
+        theoretical_gpu_slots_available,
+        theoretical_gpu_slots_available if is_enabled else 0,
+    )
 
 
 def get_openstack_resources(instance: str) -> Dict:
@@ -197,85 +232,167 @@ def get_openstack_resources(instance: str) -> Dict:
     This is a helper function that gets information from openstack in one go to calculate flavor slots
     This is quicker than getting resources one at a time
     :param instance: which cloud to calculate slots for
-    :return: a dictionary containing 4 entries, key is an openstack component,
-    value is a list of all components of that
-    type: compute_services, aggregates, hypervisors and flavors
+    :return: a dictionary containing 6 entries, key is an openstack component,
+    value is a dictionary of all components of that type keyed by id:
+    compute_services, aggregates, hypervisors and flavors
+    as well as compute_services_by_host and hypervisors_by_name - dictionaries
+    indexing compute services by host and hypervisors by name for quick lookups
     """
     conn = openstack.connect(cloud=instance)
+    # set up the compute proxy before handing it to worker threads
+    compute = conn.compute
 
     # we get all openstack info first because it is quicker than getting them one at a time
-    # dictionaries prevent duplicates
+    # each resource type is paginated separately, so fetch them all concurrently
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        # only nova-compute services are needed to validate hvs - let nova filter out the rest
+        compute_services_future = executor.submit(
+            lambda: list(compute.services(binary="nova-compute"))
+        )
+        aggregates_future = executor.submit(lambda: list(compute.aggregates()))
+        # needs to be list_hypervisors and not conn.compute.hypervisors
+        # otherwise vcpu/mem info is empty for some reason
+        hypervisors_future = executor.submit(conn.list_hypervisors)
+        flavors_future = executor.submit(
+            lambda: list(compute.flavors(get_extra_specs=True))
+        )
 
+    # dictionaries prevent duplicates
     all_compute_services = {
-        service["id"]: service for service in conn.compute.services()
+        service["id"]: service for service in compute_services_future.result()
     }
     all_aggregates = {
-        aggregate["id"]: aggregate for aggregate in conn.compute.aggregates()
-    }
-
-    # needs to be list_hypervisors and not conn.compute.hypervisors otherwise vcpu/mem info is empty for some reason
-    all_hypervisors = {h["id"]: h for h in conn.list_hypervisors()}
-    all_flavors = {
-        flavor["id"]: flavor for flavor in conn.compute.flavors(get_extra_specs=True)
+        aggregate["id"]: aggregate for aggregate in aggregates_future.result()
     }
+    all_hypervisors = {h["id"]: h for h in hypervisors_future.result()}
+    all_flavors = {flavor["id"]: flavor for flavor in flavors_future.result()}
 
     return {
-        "compute_services": list(all_compute_services.values()),
-        "aggregates": list(all_aggregates.values()),
-        "hypervisors": list(all_hypervisors.values()),
-        "flavors": list(all_flavors.values()),
+        "compute_services": all_compute_services,
+        "aggregates": all_aggregates,
+        "hypervisors": all_hypervisors,
+        "flavors": all_flavors,
+        "compute_services_by_host": {
+            service["host"]: service for service in all_compute_services.values()
+        },
+        "hypervisors_by_name": {h["name"]: h for h in all_hypervisors.values()},
     }
 
 
 def get_all_hv_info_for_aggregate(
-    aggregate: Dict, all_compute_services: List, all_hypervisors: List
+    aggregate: Dict, compute_services_by_host: Dict, hypervisors_by_name: Dict
 ) -> List:
     """
     helper function to get all useful info from hypervisors belonging to a given aggregate
     :param aggregate: aggregate that we want to get hvs for
-    :param all_compute_services: all compute services to validate hvs against
+    :param compute_services_by_host: all compute services, keyed by host, to validate hvs against
         - ensure they have a nova_compute service attached
-    :param all_hypervisors: all hypervisors to get hv info from
+    :param hypervisors_by_name: all hypervisors, keyed by name, to get hv info from
     :return: list of dictionaries of hypervisor information for calculating slots
     """
 
     valid_hvs = []
     for host in aggregate["hosts"]:
-        host_compute_service = None
-        for compute_service in all_compute_services:
-            if compute_service["host"] == host:
-                host_compute_service = compute_service
-
+        host_compute_service = compute_services_by_host.get(host)
         if not host_compute_service:
             continue
 
-        hv_obj = None
-        for hypervisor in all_hypervisors:
-            if host_compute_service["host"] == hypervisor["name"]:
-                hv_obj = hypervisor
-
-        if not hv_obj:
+        hv_obj = hypervisors_by_name.get(host_compute_service["host"])
+        # disabled hvs have no capacity to offer any flavor, so don't bother calculating slots for them
+        if not hv_obj or hv_obj["status"] == "disabled":
             continue
 
         valid_hvs.append(get_hv_info(hv_obj, aggregate, host_compute_service))
     return valid_hvs
 
 
-def update_slots(flavors: List, host_info_list: List, slots_dict: Dict) -> Dict:
+def group_identical_hvs(host_info_list: List) -> List[Tuple[HvKey, int]]:
+    """
+    Helper function that groups together hypervisors with identical capacity/availability
+    - these give identical slot results so only need calculating once
+    :param host_info_list: a list of dictionaries holding info about a hypervisor capacity/availability
+    :return: a list of tuples of (hypervisor info, number of hypervisors sharing that info)
+    """
+    hv_groups = {}
+    for hv_info in host_info_list:
+        hv_key = HvKey(**hv_info)
+        hv_groups[hv_key] = hv_groups.get(hv_key, 0) + 1
+    return list(hv_groups.items())
+
+
+def sum_slots_on_hvs(
+    calc_slots: Callable, flavor_key: FlavorKey, hv_groups: List[Tuple[HvKey, int]]
+) -> SlottifierEntry:
+    """
+    Helper function that totals the slots for a flavor across groups of identical hypervisors
+    totals are summed as plain ints so only one SlottifierEntry is built per flavor
+    :param calc_slots: function to calculate slots for the flavor on a single hypervisor
+    :param flavor_key: requirements of flavor
+    :param hv_groups: a list of tuples of (hypervisor info, number of hypervisors sharing that info)
+    :return: a SlottifierEntry holding the total slots for the flavor
+    """
+    slots_available = 0
+    estimated_gpu_slots_used = 0
+    max_gpu_slots_capacity = 0
+    max_gpu_slots_capacity_enabled = 0
+    for hypervisor, num_hvs in hv_groups:
+        hv_slots, hv_gpu_used, hv_gpu_capacity, hv_gpu_capacity_enabled = calc_slots(
+            flavor_key, hypervisor
+        )
+        slots_available += hv_slots * num_hvs
+        estimated_gpu_slots_used += hv_gpu_used * num_hvs
+        max_gpu_slots_capacity += hv_gpu_capacity * num_hvs
+        max_gpu_slots_capacity_enabled += hv_gpu_capacity_enabled * num_hvs
+
+    return SlottifierEntry(
+        slots_available=slots_available,
+        estimated_gpu_slots_used=estimated_gpu_slots_used,
+        max_gpu_slots_capacity=max_gpu_slots_capacity,
+        max_gpu_slots_capacity_enabled=max_gpu_slots_capacity_enabled,
+    )
+
+
+def update_slots(
+    flavors: List, host_info_list: List, slots_dict: Dict, flavor_reqs_by_name: Dict
+) -> Dict:
     """
     update total slots by calculating slots available for a set of flavors on a set of hosts
     :param flavors: a list of flavors
     :param host_info_list: a list of dictionaries holding info about a hypervisor capacity/availability
     :param slots_dict: dictionary of slot info to update
+    :param flavor_reqs_by_name: dictionary of flavor requirements keyed by flavor name,
+        as returned by get_flavor_requirements
     :return:
     """
-
+    hv_groups = group_identical_hvs(host_info_list)
+    # hvs without an enabled compute service can only count towards gpu capacity
+    # so can be skipped entirely for non-gpu flavors
+    enabled_hv_groups = [
+        (hypervisor, num_hvs)
+        for hypervisor, num_hvs in hv_groups
+        if hypervisor.compute_service_status == "enabled"
+    ]
     for flavor in flavors:
-        flavor_reqs = get_flavor_requirements(flavor)
-        for hypervisor in host_info_list:
-            slots_dict[flavor["name"]] += calculate_slots_on_hv(
-                flavor["name"], flavor_reqs, hypervisor
-            )
+        flavor_reqs = flavor_reqs_by_name[flavor["name"]]
+        flavor_key = FlavorKey(
+            cores_required=flavor_reqs["cores_required"],
+            mem_required=flavor_reqs["mem_required"],
+            gpus_required=flavor_reqs["gpus_required"],
+        )
+        if flavor_reqs["is_gpu"]:
+            # workaround for bugs where gpu number not specified
+            # only an error if there are hvs to calculate slots on
+            if hv_groups and flavor_reqs["gpus_required"] == 0:
+                raise RuntimeError(
+                    f"gpu flavor {flavor['name']} does not have 'gpunum' metadata"
+                )
+            calc_slots, flavor_hv_groups = _calc_gpu_slots, hv_groups
+        else:
+            calc_slots, flavor_hv_groups = _calc_cpu_slots, enabled_hv_groups
+
+        slots_dict[flavor["name"]] += sum_slots_on_hvs(
+            calc_slots, flavor_key, flavor_hv_groups
+        )
     return slots_dict
 
 
@@ -286,23 +403,37 @@ def get_slottifier_details(instance: str) -> str:
     :param instance: which cloud to calculate slots for
     :return: A data string of scraped info
     """
+    # slot calculations are memoized - clear results from any previous scrape so the cache doesn't keep growing
+    _calc_cpu_slots.cache_clear()
+    _calc_gpu_slots.cache_clear()
     all_openstack_info = get_openstack_resources(instance)
 
     slots_dict = {
-        flavor["name"]: SlottifierEntry() for flavor in all_openstack_info["flavors"]
+        flavor["name"]: SlottifierEntry()
+        for flavor in all_openstack_info["flavors"].values()
     }
-    for aggregate in all_openstack_info["aggregates"]:
-        valid_flavors = get_valid_flavors_for_aggregate(
-            all_openstack_info["flavors"], aggregate
-        )
+    flavors_by_hosttype = get_flavors_by_hosttype(
+        all_openstack_info["flavors"].values()
+    )
+
+    # flavors are parsed once, and only if they can be built on an aggregate,
+    # so a misconfigured flavor that matches no aggregate can't fail the scrape
+    flavor_reqs_by_name = {}
+    for aggregate in all_openstack_info["aggregates"].values():
+        valid_flavors = get_valid_flavors_for_aggregate(flavors_by_hosttype, aggregate)
+        for flavor in valid_flavors:
+            if flavor["name"] not in flavor_reqs_by_name:
+                flavor_reqs_by_name[flavor["name"]] = get_flavor_requirements(flavor)
 
         aggregate_host_info = get_all_hv_info_for_aggregate(
             aggregate,
-            all_openstack_info["compute_services"],
-            all_openstack_info["hypervisors"],
+            all_openstack_info["compute_services_by_host"],
+            all_openstack_info["hypervisors_by_name"],
         )
 
-        slots_dict = update_slots(valid_flavors, aggregate_host_info, slots_dict)
+        slots_dict = update_slots(
+            valid_flavors, aggregate_host_info, slots_dict, flavor_reqs_by_name
+        )
 
     return convert_to_data_string(instance, slots_dict)
 
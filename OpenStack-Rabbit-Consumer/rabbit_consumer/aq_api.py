@@ -6,6 +6,8 @@ Aquilon API
 """
 import logging
 import subprocess
+import time
+from functools import lru_cache
 from typing import Optional, List
 
 import requests
@@ -13,7 +15,7 @@ from requests.adapters import HTTPAdapter
 from requests_kerberos import HTTPKerberosAuth
 from urllib3.util.retry import Retry
 
-from rabbit_consumer.consumer_config import ConsumerConfig
+from rabbit_consumer.consumer_config import get_config
 from rabbit_consumer.aq_metadata import AqMetadata
 from rabbit_consumer.openstack_address import OpenstackAddress
 from rabbit_consumer.rabbit_message import RabbitMessage
@@ -26,8 +28,14 @@ UPDATE_INTERFACE_SUFFIX = "/machine/{0}/interface/{1}?boot&default_route"
 DELETE_HOST_SUFFIX = "/host/{0}"
 DELETE_MACHINE_SUFFIX = "/machine/{0}"
 
+# How long (in seconds) a successful Kerberos ticket check is trusted before checking again
+KERBEROS_CHECK_TTL = 30.0
+
 logger = logging.getLogger(__name__)
 
+# Monotonic time of the last successful Kerberos ticket check
+_KERBEROS_CHECK = {"last_success": None}
+
 
 class AquilonError(Exception):
     """
@@ -39,16 +47,47 @@ def verify_kerberos_ticket() -> bool:
     """
     Check for a valid Kerberos ticket from a sidecar, or on the host
     Raises a RuntimeError if no ticket is found
+    A successful check is reused for KERBEROS_CHECK_TTL seconds, to avoid
+    running klist for every request made to Aquilon
     """
+    now = time.monotonic()
+    last_success = _KERBEROS_CHECK["last_success"]
+    if last_success is not None and now - last_success < KERBEROS_CHECK_TTL:
+        return True
+
     logger.debug("Checking for valid Kerberos Ticket")
 
     if subprocess.call(["klist", "-s"]) == 1:
+        _KERBEROS_CHECK["last_success"] = None
         raise RuntimeError("No shared Kerberos ticket found.")
 
     logger.debug("Kerberos ticket success")
+    _KERBEROS_CHECK["last_success"] = now
     return True
 
 
+@lru_cache(maxsize=1)
+def get_session() -> requests.Session:
+    """
+    Creates the requests session used for all Aquilon API calls.
+    This is only created once, so connections to Aquilon are kept alive between calls
+    """
+    session = requests.Session()
+    session.verify = "/etc/grid-security/certificates/aquilon-gridpp-rl-ac-uk-chain.pem"
+    # Only GETs are retried on a bad status, as retrying POST/PUT/DELETE requests
+    # could repeat changes to Aquilon, e.g. creating the same machine twice
+    retries = Retry(
+        total=5,
+        allowed_methods=["GET"],
+        status_forcelist=[502, 503, 504],
+        backoff_factor=0.2,
+        respect_retry_after_header=True,
+    )
+    session.mount("https://", HTTPAdapter(max_retries=retries))
+    session.auth = HTTPKerberosAuth()
+    return session
+
+
 def setup_requests(
     url: str, method: str, desc: str, params: Optional[dict] = None
 ) -> str:
@@ -58,18 +97,9 @@ def setup_requests(
     verify_kerberos_ticket()
     logger.debug("%s: %s - params: %s", method, url, params)
 
-    session = requests.Session()
-    session.verify = "/etc/grid-security/certificates/aquilon-gridpp-rl-ac-uk-chain.pem"
-    retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[503])
-    session.mount("https://", HTTPAdapter(max_retries=retries))
-    if method == "post":
-        response = session.post(url, auth=HTTPKerberosAuth(), params=params)
-    elif method == "put":
-        response = session.put(url, auth=HTTPKerberosAuth(), params=params)
-    elif method == "delete":
-        response = session.delete(url, auth=HTTPKerberosAuth(), params=params)
-    else:
-        response = session.get(url, auth=HTTPKerberosAuth(), params=params)
+    if method not in ("post", "put", "delete"):
+        method = "get"
+    response = get_session().request(method, url, params=params)
 
     if response.status_code == 400:
         # This might be an expected error, so don't log it
@@ -101,7 +131,7 @@ def aq_make(addresses: List[OpenstackAddress]) -> None:
     if not hostname or not hostname.strip():
         raise ValueError("Hostname cannot be empty")
 
-    url = ConsumerConfig().aq_url + f"/host/{hostname}/command/make"
+    url = get_config().aq_url + f"/host/{hostname}/command/make"
     try:
         setup_requests(url, "post", "Make Template")
     # suppressing 400 error that occurs - the VM gets created fine
@@ -127,7 +157,7 @@ def aq_manage(addresses: List[OpenstackAddress], image_meta: AqMetadata) -> None
     else:
         params["domain"] = image_meta.aq_domain
 
-    url = ConsumerConfig().aq_url + f"/host/{hostname}/command/manage"
+    url = get_config().aq_url + f"/host/{hostname}/command/manage"
     setup_requests(url, "post", "Manage Host", params=params)
 
 
@@ -145,7 +175,8 @@ def create_machine(message: RabbitMessage, vm_data: VmData) -> str:
         "memory": message.payload.memory_mb,
     }
 
-    url = ConsumerConfig().aq_url + f"/next_machine/{ConsumerConfig().aq_prefix}"
+    config = get_config()
+    url = config.aq_url + f"/next_machine/{config.aq_prefix}"
     response = setup_requests(url, "put", "Create Machine", params=params)
     return response
 
@@ -156,7 +187,7 @@ def delete_machine(machine_name: str) -> None:
     """
     logger.debug("Attempting to delete machine for %s", machine_name)
 
-    url = ConsumerConfig().aq_url + DELETE_MACHINE_SUFFIX.format(machine_name)
+    url = get_config().aq_url + DELETE_MACHINE_SUFFIX.format(machine_name)
 
     setup_requests(url, "delete", "Delete Machine")
 
@@ -167,7 +198,7 @@ def create_host(
     """
     Creates a host in Aquilon
     """
-    config = ConsumerConfig()
+    config = get_config()
 
     address = addresses[0]
     params = {
@@ -194,7 +225,7 @@ def delete_host(hostname: str) -> None:
     Deletes a host in Aquilon
     """
     logger.debug("Attempting to delete host for %s ", hostname)
-    url = ConsumerConfig().aq_url + DELETE_HOST_SUFFIX.format(hostname)
+    url = get_config().aq_url + DELETE_HOST_SUFFIX.format(hostname)
     setup_requests(url, "delete", "Host Delete")
 
 
@@ -203,7 +234,7 @@ def delete_address(address: str, machine_name: str) -> None:
     Deletes an address in Aquilon
     """
     logger.debug("Attempting to delete address for %s ", address)
-    url = ConsumerConfig().aq_url + "/interface_address"
+    url = get_config().aq_url + "/interface_address"
     params = {"ip": address, "machine": machine_name, "interface": "eth0"}
     setup_requests(url, "delete", "Address Delete", params=params)
 
@@ -213,7 +244,7 @@ def delete_interface(machine_name: str) -> None:
     Deletes a host interface in Aquilon
     """
     logger.debug("Attempting to delete interface for %s ", machine_name)
-    url = ConsumerConfig().aq_url + "/interface/command/del"
+    url = get_config().aq_url + "/interface/command/del"
     params = {"interface": "eth0", "machine": machine_name}
     setup_requests(url, "post", "Interface Delete", params=params)
 
@@ -233,9 +264,7 @@ def add_machine_nics(machine_name: str, addresses: List[OpenstackAddress]) -> No
         interface_name,
         machine_name,
     )
-    url = (
-        ConsumerConfig().aq_url + f"/machine/{machine_name}/interface/{interface_name}"
-    )
+    url = get_config().aq_url + f"/machine/{machine_name}/interface/{interface_name}"
     setup_requests(
         url, "put", "Add Machine Interface", params={"mac": address.mac_addr}
     )
@@ -247,7 +276,7 @@ def set_interface_bootable(machine_name: str, interface_name: str) -> None:
     """
     logger.debug("Attempting to bootable %s ", machine_name)
 
-    url = ConsumerConfig().aq_url + UPDATE_INTERFACE_SUFFIX.format(
+    url = get_config().aq_url + UPDATE_INTERFACE_SUFFIX.format(
         machine_name, interface_name
     )
 
@@ -259,7 +288,7 @@ def search_machine_by_serial(vm_data: VmData) -> Optional[str]:
     Searches for a machine in Aquilon based on a serial number
     """
     logger.debug("Searching for host with serial %s", vm_data.virtual_machine_id)
-    url = ConsumerConfig().aq_url + "/find/machine"
+    url = get_config().aq_url + "/find/machine"
     params = {"serial": vm_data.virtual_machine_id}
     response = setup_requests(url, "get", "Search Host", params=params).strip()
 
@@ -273,7 +302,7 @@ def search_host_by_machine(machine_name: str) -> Optional[str]:
     Searches for a host in Aquilon based on a machine name
     """
     logger.debug("Searching for host with machine name %s", machine_name)
-    url = ConsumerConfig().aq_url + "/find/host"
+    url = get_config().aq_url + "/find/host"
     params = {"machine": machine_name}
     response = setup_requests(url, "get", "Search Host", params=params).strip()
 
@@ -287,7 +316,7 @@ def get_machine_details(machine_name: str) -> str:
     Gets a machine's details as a string
     """
     logger.debug("Getting machine details for %s", machine_name)
-    url = ConsumerConfig().aq_url + f"/machine/{machine_name}"
+    url = get_config().aq_url + f"/machine/{machine_name}"
     return setup_requests(url, "get", "Get machine details").strip()
 
 
@@ -296,7 +325,7 @@ def check_host_exists(hostname: str) -> bool:
     Checks if a host exists in Aquilon
     """
     logger.debug("Checking if hostname exists: %s", hostname)
-    url = ConsumerConfig().aq_url + HOST_CHECK_SUFFIX.format(hostname)
+    url = get_config().aq_url + HOST_CHECK_SUFFIX.format(hostname)
     try:
         setup_requests(url, "get", "Check Host")
     except AquilonError as err:
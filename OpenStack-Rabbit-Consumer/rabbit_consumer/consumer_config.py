@@ -7,10 +7,10 @@ credentials are not exposed
 
 import os
 from dataclasses import dataclass, field
-from functools import partial
+from functools import lru_cache, partial
 
 
-@dataclass
+@dataclass(frozen=True)
 class _AqFields:
     """
     Dataclass for all Aquilon config elements. These are pulled from
@@ -21,7 +21,7 @@ class _AqFields:
     aq_url: str = field(default_factory=partial(os.getenv, "AQ_URL"))
 
 
-@dataclass
+@dataclass(frozen=True)
 class _OpenstackFields:
     """
     Dataclass for all Openstack config elements. These are pulled from
@@ -42,7 +42,7 @@ class _OpenstackFields:
     )
 
 
-@dataclass
+@dataclass(frozen=True)
 class _RabbitFields:
     """
     Dataclass for all RabbitMQ config elements. These are pulled from
@@ -59,8 +59,18 @@ class _RabbitFields:
     )
 
 
-@dataclass
+@dataclass(frozen=True)
 class ConsumerConfig(_AqFields, _OpenstackFields, _RabbitFields):
     """
-    Mix-in class for all known config elements
+    Mix-in class for all known config elements.
+    Frozen, as a single instance is shared by all callers of get_config
     """
+
+
+@lru_cache(maxsize=1)
+def get_config() -> ConsumerConfig:
+    """
+    Returns the config for the consumer. The environment is only read
+    on the first call, the same config is then returned for all later calls
+    """
+    return ConsumerConfig()
@@ -4,17 +4,22 @@
 This file manages how rabbit messages stating AQ VM creation and deletion 
 should be handled and processed between the consumer and Aquilon
 """
-import json
 import logging
 import socket
 from typing import Optional, List
 
 import rabbitpy
 
+try:
+    # orjson parses messages considerably faster, and accepts the raw bytes of the body
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
 from rabbit_consumer import aq_api
 from rabbit_consumer import openstack_api
 from rabbit_consumer.aq_api import verify_kerberos_ticket
-from rabbit_consumer.consumer_config import ConsumerConfig
+from rabbit_consumer.consumer_config import ConsumerConfig, get_config
 from rabbit_consumer.aq_metadata import AqMetadata
 from rabbit_consumer.openstack_address import OpenstackAddress
 from rabbit_consumer.rabbit_message import RabbitMessage, MessageEventType
@@ -25,6 +30,11 @@ SUPPORTED_MESSAGE_TYPES = {
     "create": "compute.instance.create.end",
     "delete": "compute.instance.delete.start",
 }
+# Set of supported event types, for checking each message against
+_SUPPORTED_EVENT_TYPES = frozenset(SUPPORTED_MESSAGE_TYPES.values())
+
+# Maximum number of unacknowledged messages rabbit will send to the consumer at once
+PREFETCH_COUNT = 100
 
 
 def is_aq_managed_image(vm_data: VmData) -> bool:
@@ -224,9 +234,8 @@ def add_aq_details_to_metadata(
         )
         return
 
-    hostnames = [i.hostname for i in network_details]
     metadata = {
-        "HOSTNAMES": ",".join(hostnames),
+        "HOSTNAMES": ",".join(i.hostname for i in network_details),
         "AQ_STATUS": "SUCCESS",
         "AQ_MACHINE": aq_api.search_machine_by_serial(vm_data),
     }
@@ -240,9 +249,9 @@ def on_message(message: rabbitpy.Message) -> None:
     raw_body = message.body
     logger.debug("New message: %s", raw_body)
 
-    body = json.loads(raw_body.decode("utf-8"))["oslo.message"]
+    body = _json_loads(raw_body)["oslo.message"]
     parsed_event = MessageEventType.from_json(body)
-    if parsed_event.event_type not in SUPPORTED_MESSAGE_TYPES.values():
+    if parsed_event.event_type not in _SUPPORTED_EVENT_TYPES:
         logger.info("Ignoring event_type: %s", parsed_event.event_type)
         message.ack()
         return
@@ -292,11 +301,13 @@ def initiate_consumer() -> None:
 
     exchanges = ["nova"]
 
-    config = ConsumerConfig()
+    config = get_config()
     login_str = generate_login_str(config)
     with rabbitpy.Connection(login_str) as conn:
         with conn.channel() as channel:
             logger.debug("Connected to RabbitMQ")
+            # Without a prefetch limit rabbit pushes the whole queue to the consumer
+            channel.prefetch_count(PREFETCH_COUNT)
 
             # Durable indicates that the queue will survive a broker restart
             queue = rabbitpy.Queue(channel, name="ral.info", durable=True)
@@ -11,7 +11,7 @@ import openstack
 from openstack.compute.v2.image import Image
 from openstack.compute.v2.server import Server
 
-from rabbit_consumer.consumer_config import ConsumerConfig
+from rabbit_consumer.consumer_config import get_config
 from rabbit_consumer.openstack_address import OpenstackAddress
 from rabbit_consumer.vm_data import VmData
 
@@ -28,10 +28,11 @@ class OpenstackConnection:
         self.conn = None
 
     def __enter__(self):
+        config = get_config()
         self.conn = openstack.connect(
-            auth_url=ConsumerConfig().openstack_auth_url,
-            username=ConsumerConfig().openstack_username,
-            password=ConsumerConfig().openstack_password,
+            auth_url=config.openstack_auth_url,
+            username=config.openstack_username,
+            password=config.openstack_password,
             project_name="admin",
             user_domain_name="Default",
             project_domain_name="default",
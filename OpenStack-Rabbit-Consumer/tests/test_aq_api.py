@@ -11,7 +11,9 @@ import pytest
 
 # noinspection PyUnresolvedReferences
 from rabbit_consumer.aq_api import (
+    KERBEROS_CHECK_TTL,
     verify_kerberos_ticket,
+    get_session,
     setup_requests,
     aq_make,
     aq_manage,
@@ -28,6 +30,15 @@ from rabbit_consumer.aq_api import (
 )
 
 
+@pytest.fixture(autouse=True)
+def clear_kerberos_check():
+    """
+    Clears any cached Kerberos ticket check so each test runs klist itself
+    """
+    with patch.dict("rabbit_consumer.aq_api._KERBEROS_CHECK", {"last_success": None}):
+        yield
+
+
 def test_verify_kerberos_ticket_valid():
     """
     Test that verify_kerberos_ticket returns True when the ticket is valid
@@ -54,80 +65,168 @@ def test_verify_kerberos_ticket_invalid(subprocess):
     subprocess.assert_called_once_with(["klist", "-s"])
 
 
+@patch("rabbit_consumer.aq_api.time.monotonic")
+@patch("rabbit_consumer.aq_api.subprocess.call")
+def test_verify_kerberos_ticket_cached(subprocess, monotonic):
+    """
+    Test that verify_kerberos_ticket reuses a successful check within the TTL
+    and checks again once the TTL has passed
+    """
+    subprocess.return_value = 0
+    monotonic.side_effect = [
+        100.0,
+        100.0 + KERBEROS_CHECK_TTL - 1,
+        100.0 + KERBEROS_CHECK_TTL,
+    ]
+
+    assert verify_kerberos_ticket()
+    assert verify_kerberos_ticket()
+    subprocess.assert_called_once_with(["klist", "-s"])
+
+    assert verify_kerberos_ticket()
+    assert subprocess.call_count == 2
+
+
+@patch("rabbit_consumer.aq_api.subprocess.call")
+def test_verify_kerberos_ticket_invalid_not_cached(subprocess):
+    """
+    Test that verify_kerberos_ticket checks again after an invalid ticket
+    """
+    subprocess.side_effect = [1, 0]
+
+    with pytest.raises(RuntimeError):
+        verify_kerberos_ticket()
+    assert verify_kerberos_ticket()
+    assert subprocess.call_count == 2
+
+
+@pytest.fixture(autouse=True)
+def clear_session_cache():
+    """
+    Clears the cached Aquilon session so each test sets up its own
+    """
+    get_session.cache_clear()
+    yield
+    get_session.cache_clear()
+
+
 @patch("rabbit_consumer.aq_api.requests")
 @patch("rabbit_consumer.aq_api.Retry")
 @patch("rabbit_consumer.aq_api.HTTPAdapter")
-@patch("rabbit_consumer.aq_api.verify_kerberos_ticket")
-def test_setup_requests(verify_kerb, adapter, retry, requests):
+@patch("rabbit_consumer.aq_api.HTTPKerberosAuth")
+def test_get_session(kerb_auth, adapter, retry, requests):
     """
-    Test that setup_requests sets up the Kerberos ticket and the requests session
-    correctly
+    Test that get_session sets up the requests session correctly
     """
     session = requests.Session.return_value
-    response = session.get.return_value
-    response.status_code = 200
-
-    setup_requests(NonCallableMock(), NonCallableMock(), NonCallableMock())
+    assert get_session() == session
     assert (
         session.verify
         == "/etc/grid-security/certificates/aquilon-gridpp-rl-ac-uk-chain.pem"
     )
-
-    verify_kerb.assert_called_once()
-    retry.assert_called_once_with(total=5, backoff_factor=0.1, status_forcelist=[503])
+    assert session.auth == kerb_auth.return_value
+
+    retry.assert_called_once_with(
+        total=5,
+        backoff_factor=0.2,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+    )
     adapter.assert_called_once_with(max_retries=retry.return_value)
     session.mount.assert_called_once_with("https://", adapter.return_value)
 
 
+@pytest.mark.parametrize(
+    "method,retryable", [("GET", True), ("POST", False), ("PUT", False)]
+)
+def test_get_session_only_retries_get(method, retryable):
+    """
+    Test that the session only retries GET requests on a bad status,
+    so changes to Aquilon are never repeated
+    """
+    retries = get_session().get_adapter("https://").max_retries
+    assert retries.is_retry(method, status_code=503) == retryable
+
+
 @patch("rabbit_consumer.aq_api.requests")
 @patch("rabbit_consumer.aq_api.Retry")
 @patch("rabbit_consumer.aq_api.HTTPAdapter")
+@patch("rabbit_consumer.aq_api.HTTPKerberosAuth")
+def test_get_session_reused(_, __, ___, requests):
+    """
+    Test that get_session only creates a single session which is reused between calls
+    """
+    assert get_session() == get_session()
+    requests.Session.assert_called_once()
+
+
+@patch("rabbit_consumer.aq_api.get_session")
 @patch("rabbit_consumer.aq_api.verify_kerberos_ticket")
-def test_setup_requests_throws_for_failed(verify_kerb, adapter, retry, requests):
+def test_setup_requests(verify_kerb, get_session_mock):
+    """
+    Test that setup_requests checks the Kerberos ticket and uses the shared session
+    """
+    session = get_session_mock.return_value
+    response = session.request.return_value
+    response.status_code = 200
+
+    url, params = NonCallableMock(), NonCallableMock()
+    assert setup_requests(url, "get", NonCallableMock(), params) == response.text
+
+    verify_kerb.assert_called_once()
+    session.request.assert_called_once_with("get", url, params=params)
+
+
+@patch("rabbit_consumer.aq_api.get_session")
+@patch("rabbit_consumer.aq_api.verify_kerberos_ticket")
+def test_setup_requests_throws_for_failed(verify_kerb, get_session_mock):
     """
     Test that setup_requests throws an exception when the connection fails
     """
-    session = requests.Session.return_value
-    response = session.get.return_value
+    session = get_session_mock.return_value
+    response = session.request.return_value
     response.status_code = 500
 
     with pytest.raises(ConnectionError):
         setup_requests(NonCallableMock(), NonCallableMock(), NonCallableMock())
 
-    assert (
-        session.verify
-        == "/etc/grid-security/certificates/aquilon-gridpp-rl-ac-uk-chain.pem"
-    )
-
     verify_kerb.assert_called_once()
-    retry.assert_called_once_with(total=5, backoff_factor=0.1, status_forcelist=[503])
-    adapter.assert_called_once_with(max_retries=retry.return_value)
-    session.mount.assert_called_once_with("https://", adapter.return_value)
-    session.get.assert_called_once()
+    session.request.assert_called_once()
+
+
+@patch("rabbit_consumer.aq_api.get_session")
+@patch("rabbit_consumer.aq_api.verify_kerberos_ticket")
+def test_setup_requests_throws_for_aquilon_error(_, get_session_mock):
+    """
+    Test that setup_requests throws an AquilonError when Aquilon rejects the request
+    """
+    response = get_session_mock.return_value.request.return_value
+    response.status_code = 400
+
+    with pytest.raises(AquilonError):
+        setup_requests(NonCallableMock(), "get", NonCallableMock())
 
 
 @pytest.mark.parametrize("rest_verb", ["get", "post", "put", "delete"])
-@patch("rabbit_consumer.aq_api.requests")
-@patch("rabbit_consumer.aq_api.HTTPKerberosAuth")
+@patch("rabbit_consumer.aq_api.get_session")
 @patch("rabbit_consumer.aq_api.verify_kerberos_ticket")
-def test_setup_requests_rest_methods(_, kerb_auth, requests, rest_verb):
+def test_setup_requests_rest_methods(_, get_session_mock, rest_verb):
     """
     Test that setup_requests calls the correct REST method
     """
     url, desc, params = NonCallableMock(), NonCallableMock(), NonCallableMock()
 
-    session = requests.Session.return_value
-
-    rest_method = getattr(session, rest_verb)
-    response = rest_method.return_value
+    session = get_session_mock.return_value
+    response = session.request.return_value
     response.status_code = 200
 
     assert setup_requests(url, rest_verb, desc, params) == response.text
-    rest_method.assert_called_once_with(url, auth=kerb_auth.return_value, params=params)
+    session.request.assert_called_once_with(rest_verb, url, params=params)
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_aq_make_calls(config, setup, openstack_address_list):
     """
     Test that aq_make calls the correct URLs with the correct parameters
@@ -142,7 +241,7 @@ def test_aq_make_calls(config, setup, openstack_address_list):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_aq_make_aquilon_error(config, setup, openstack_address_list):
     """
     Test that aq_make doesn't fail when aquilon error raised
@@ -163,7 +262,7 @@ def test_aq_make_aquilon_error(config, setup, openstack_address_list):
 
 @pytest.mark.parametrize("hostname", ["  ", "", None])
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_aq_make_none_hostname(config, setup, openstack_address, hostname):
     """
     Test that aq_make throws an exception if the field is missing
@@ -181,7 +280,7 @@ def test_aq_make_none_hostname(config, setup, openstack_address, hostname):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_aq_manage(config, setup, openstack_address_list, image_metadata):
     """
     Test that aq_manage calls the correct URLs with the correct parameters
@@ -202,7 +301,7 @@ def test_aq_manage(config, setup, openstack_address_list, image_metadata):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_aq_manage_with_sandbox(config, setup, openstack_address_list, image_metadata):
     """
     Test that aq_manage calls the correct URLs with the sandbox
@@ -225,7 +324,7 @@ def test_aq_manage_with_sandbox(config, setup, openstack_address_list, image_met
     setup.assert_called_once_with(expected_url, "post", mock.ANY, params=expected_param)
 
 
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 @patch("rabbit_consumer.aq_api.setup_requests")
 def test_aq_create_machine(setup, config, rabbit_message, vm_data):
     """
@@ -250,7 +349,7 @@ def test_aq_create_machine(setup, config, rabbit_message, vm_data):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_aq_delete_machine(config, setup):
     """
     Test that aq_delete_machine calls the correct URL with the correct parameters
@@ -266,7 +365,7 @@ def test_aq_delete_machine(config, setup):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_aq_create_host(config, setup, openstack_address_list, image_metadata):
     """
     Test that aq_create_host calls the correct URL with the correct parameters
@@ -294,7 +393,7 @@ def test_aq_create_host(config, setup, openstack_address_list, image_metadata):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_aq_create_host_with_sandbox(
     config, setup, openstack_address_list, image_metadata
 ):
@@ -327,7 +426,7 @@ def test_aq_create_host_with_sandbox(
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_aq_delete_host(config, setup):
     """
     Test that aq_delete_host calls the correct URL with the correct parameters
@@ -343,7 +442,7 @@ def test_aq_delete_host(config, setup):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_add_machine_nic(config, setup, openstack_address_list):
     """
     Test that add_machine_interface calls the correct URL with the correct parameters
@@ -364,7 +463,7 @@ def test_add_machine_nic(config, setup, openstack_address_list):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_update_machine_interface(config, setup):
     """
     Test that update_machine_interface calls the correct URL with the correct parameters
@@ -381,7 +480,7 @@ def test_update_machine_interface(config, setup):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_check_host_exists(config, setup):
     """
     Test that check_host_exists calls the correct URL with the correct parameters
@@ -397,7 +496,7 @@ def test_check_host_exists(config, setup):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_check_host_exists_returns_false(config, setup):
     """
     Test that check_host_exists calls the correct URL with the correct parameters
@@ -411,7 +510,7 @@ def test_check_host_exists_returns_false(config, setup):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_search_machine_by_serial(config, setup, vm_data):
     """
     Test that search_machine_by_serial calls the correct URL with the correct parameters
@@ -426,7 +525,7 @@ def test_search_machine_by_serial(config, setup, vm_data):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_search_machine_by_serial_not_found(config, setup, vm_data):
     """
     Test that search_machine_by_serial calls the correct URL with the correct parameters
@@ -442,7 +541,7 @@ def test_search_machine_by_serial_not_found(config, setup, vm_data):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_search_host_by_machine(config, setup):
     """
     Test that search_host_by_machine calls the correct URL with the correct parameters
@@ -458,7 +557,7 @@ def test_search_host_by_machine(config, setup):
 
 
 @patch("rabbit_consumer.aq_api.setup_requests")
-@patch("rabbit_consumer.aq_api.ConsumerConfig")
+@patch("rabbit_consumer.aq_api.get_config")
 def test_search_host_by_machine_not_found(config, setup):
     """
     Test that search_host_by_machine calls the correct URL with the correct parameters
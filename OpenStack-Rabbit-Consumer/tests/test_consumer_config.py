@@ -4,9 +4,11 @@
 Test the consumer config class, this handles the environment variables
 that are used to configure the consumer.
 """
+from dataclasses import FrozenInstanceError
+
 import pytest
 
-from rabbit_consumer.consumer_config import ConsumerConfig
+from rabbit_consumer.consumer_config import ConsumerConfig, get_config
 
 AQ_FIELDS = [
     ("aq_prefix", "AQ_PREFIX"),
@@ -38,3 +40,28 @@ def test_config_gets_os_env_vars(monkeypatch, config_name, env_var):
     expected = "MOCK_ENV"
     monkeypatch.setenv(env_var, expected)
     assert getattr(ConsumerConfig(), config_name) == expected
+
+
+def test_get_config_is_cached(monkeypatch):
+    """
+    Test that get_config only reads the environment once
+    and returns the same config on subsequent calls
+    """
+    get_config.cache_clear()
+    monkeypatch.setenv("AQ_URL", "first")
+    config = get_config()
+    assert config.aq_url == "first"
+
+    monkeypatch.setenv("AQ_URL", "second")
+    assert get_config() is config
+    assert get_config().aq_url == "first"
+    get_config.cache_clear()
+
+
+def test_config_is_frozen():
+    """
+    Test that the config cannot be modified, as the same config
+    is shared by all callers of get_config
+    """
+    with pytest.raises(FrozenInstanceError):
+        ConsumerConfig().aq_url = "modified"
@@ -4,7 +4,9 @@
 Tests the message consumption flow
 for the consumer
 """
-from unittest.mock import Mock, NonCallableMock, patch, call, MagicMock
+from dataclasses import replace
+from types import SimpleNamespace
+from unittest.mock import Mock, NonCallableMock, patch, call, MagicMock, DEFAULT
 
 import pytest
 
@@ -36,69 +38,71 @@ def fixture_valid_event_type():
     return mock
 
 
-@patch("rabbit_consumer.message_consumer.consume")
-@patch("rabbit_consumer.message_consumer.MessageEventType")
-@patch("rabbit_consumer.message_consumer.RabbitMessage")
-def test_on_message_parses_json(
-    message_parser, message_event_type, consume, valid_event_type
-):
+@pytest.fixture(name="on_message_mocks")
+def fixture_on_message_mocks():
+    """
+    Patches everything on_message calls out to in one go,
+    providing the mocks as attributes of a namespace
+    """
+    with patch.multiple(
+        "rabbit_consumer.message_consumer",
+        consume=DEFAULT,
+        MessageEventType=DEFAULT,
+        RabbitMessage=DEFAULT,
+        _json_loads=DEFAULT,
+        is_aq_managed_image=DEFAULT,
+    ) as mocks:
+        yield SimpleNamespace(json_loads=mocks.pop("_json_loads"), **mocks)
+
+
+def test_on_message_parses_json(on_message_mocks, valid_event_type):
     """
     Test that the function parses the message body as JSON
     """
-    message_event_type.from_json.return_value = valid_event_type
+    on_message_mocks.MessageEventType.from_json.return_value = valid_event_type
 
-    with (
-        patch("rabbit_consumer.message_consumer.json") as json,
-        patch("rabbit_consumer.message_consumer.is_aq_managed_image"),
-    ):
-        message = Mock()
-        on_message(message)
+    message = Mock()
+    on_message(message)
 
-    decoded_body = json.loads.return_value
+    message_parser = on_message_mocks.RabbitMessage
+    on_message_mocks.json_loads.assert_called_once_with(message.body)
+    decoded_body = on_message_mocks.json_loads.return_value
     message_parser.from_json.assert_called_once_with(decoded_body["oslo.message"])
-    consume.assert_called_once_with(message_parser.from_json.return_value)
+    on_message_mocks.consume.assert_called_once_with(
+        message_parser.from_json.return_value
+    )
     message.ack.assert_called_once()
 
 
-@patch("rabbit_consumer.message_consumer.consume")
-@patch("rabbit_consumer.message_consumer.is_aq_managed_image")
-@patch("rabbit_consumer.message_consumer.MessageEventType")
-def test_on_message_ignores_wrong_message_type(message_event_type, is_managed, consume):
+def test_on_message_ignores_wrong_message_type(on_message_mocks):
     """
     Test that the function ignores messages with the wrong message type
     """
     message_event = NonCallableMock()
     message_event.event_type = "wrong"
-    message_event_type.from_json.return_value = message_event
+    on_message_mocks.MessageEventType.from_json.return_value = message_event
 
-    with patch("rabbit_consumer.message_consumer.json"):
-        message = Mock()
-        on_message(message)
+    message = Mock()
+    on_message(message)
 
-    is_managed.assert_not_called()
-    consume.assert_not_called()
+    on_message_mocks.is_aq_managed_image.assert_not_called()
+    on_message_mocks.consume.assert_not_called()
     message.ack.assert_called_once()
 
 
 @pytest.mark.parametrize("event_type", SUPPORTED_MESSAGE_TYPES.values())
-@patch("rabbit_consumer.message_consumer.consume")
-@patch("rabbit_consumer.message_consumer.MessageEventType")
-def test_on_message_accepts_event_types(message_event_type, consume, event_type):
+def test_on_message_accepts_event_types(on_message_mocks, event_type):
     """
     Test that the function accepts the correct event types
     """
     message_event = NonCallableMock()
     message_event.event_type = event_type
-    message_event_type.from_json.return_value = message_event
+    on_message_mocks.MessageEventType.from_json.return_value = message_event
 
-    with (
-        patch("rabbit_consumer.message_consumer.RabbitMessage"),
-        patch("rabbit_consumer.message_consumer.json"),
-    ):
-        message = Mock()
-        on_message(message)
+    message = Mock()
+    on_message(message)
 
-    consume.assert_called_once()
+    on_message_mocks.consume.assert_called_once()
     message.ack.assert_called_once()
 
 
@@ -107,14 +111,13 @@ def mocked_config_fixture() -> ConsumerConfig:
     """
     Provides a mocked input config for the consumer
     """
-    config = ConsumerConfig()
-
-    # Note: the mismatched spaces are intentional
-    config.rabbit_hosts = "rabbit_host1, rabbit_host2,rabbit_host3"
-    config.rabbit_port = 1234
-    config.rabbit_username = "rabbit_username"
-    config.rabbit_password = "rabbit_password"
-    return config
+    return ConsumerConfig(
+        # Note: the mismatched spaces are intentional
+        rabbit_hosts="rabbit_host1, rabbit_host2,rabbit_host3",
+        rabbit_port=1234,
+        rabbit_username="rabbit_username",
+        rabbit_password="rabbit_password",
+    )
 
 
 def test_generate_login_str(mocked_config):
@@ -135,7 +138,7 @@ def test_generate_login_str_no_hosts(mocked_config):
     """
     Test that the function raises if nothing is passed
     """
-    mocked_config.rabbit_hosts = ""
+    mocked_config = replace(mocked_config, rabbit_hosts="")
     with pytest.raises(ValueError):
         assert generate_login_str(mocked_config)
 
@@ -144,7 +147,7 @@ def test_generate_login_non_str(mocked_config):
     """
     Test that the function raises if the input is not a string
     """
-    mocked_config.rabbit_hosts = 1234
+    mocked_config = replace(mocked_config, rabbit_hosts=1234)
     with pytest.raises(ValueError):
         assert generate_login_str(mocked_config)
 
@@ -171,7 +174,7 @@ def test_initiate_consumer_channel_setup(rabbitpy, gen_login, _, mocked_config):
     """
     Test that the function sets up the channel and queue correctly
     """
-    with patch("rabbit_consumer.message_consumer.ConsumerConfig") as config:
+    with patch("rabbit_consumer.message_consumer.get_config") as config:
         config.return_value = mocked_config
         initiate_consumer()
 
@@ -181,6 +184,7 @@ def test_initiate_consumer_channel_setup(rabbitpy, gen_login, _, mocked_config):
     connection = rabbitpy.Connection.return_value.__enter__.return_value
     connection.channel.assert_called_once()
     channel = connection.channel.return_value.__enter__.return_value
+    channel.prefetch_count.assert_called_once_with(100)
 
     rabbitpy.Queue.assert_called_once_with(channel, name="ral.info", durable=True)
     queue = rabbitpy.Queue.return_value
@@ -17,7 +17,7 @@ from rabbit_consumer.openstack_api import (
 )
 
 
-@patch("rabbit_consumer.openstack_api.ConsumerConfig")
+@patch("rabbit_consumer.openstack_api.get_config")
 @patch("rabbit_consumer.openstack_api.openstack.connect")
 def test_openstack_connection(mock_connect, mock_config):
     """
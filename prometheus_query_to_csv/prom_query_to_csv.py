@@ -1,14 +1,30 @@
 #!/usr/bin/env python3
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Callable, Iterator, Any
 from datetime import datetime
 import json
 import socket
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+@lru_cache(maxsize=1 << 16)
+def format_timestamp(timestamp: float) -> str:
+    """
+    This function converts a Prometheus timestamp to the local date time string used in the CSV.
+    Series from the same query share their timestamps, so each one is only converted once.
+    :param timestamp: Unix timestamp of the sample
+    :return: The formatted date and time
+    """
+    return str(datetime.fromtimestamp(timestamp))
 
 
 class RawData:
     """
-    This class gets the raw JSON data from the Prometheus endpoint and writes that to files.
+    This class gets the raw JSON data from the Prometheus endpoint and writes that to files,
+    either as is or converted straight to CSV.
     """
 
     def __init__(self, metrics: List[str], start: str, end: str, url: str):
@@ -17,29 +33,86 @@ class RawData:
         self.end = end
         self.step = 60
         self.endpoint = url
+        # A single session is shared by all queries so connections to Prometheus are reused
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.2),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.csv_writer = JsonToCSV(metrics)
 
     def request_to_json_file(self):
         """
         This method runs the request and write function for each metric you want to query for.
         It will write into CSV files called the metrics name.
+        The metrics are queried concurrently, so waiting on Prometheus for each query overlaps.
         """
-        for metric in self.metrics:
-            payload = {
-                "query": metric,
-                "start": self.start,
-                "end": self.end,
-                "step": self.step,
-            }
-            response = self.http_request(payload)
-            self.write_json_file(metric, response)
+        # list() so every metric is written and any error raised querying a metric is raised here
+        list(self.run_for_each_metric(self.request_metric_to_json_file))
+
+    def request_to_csv(self):
+        """
+        This method runs the request for each metric you want to query for and writes the results as CSV files.
+        Each response is parsed once and converted straight to CSV, rather than saved as JSON and read back in.
+        Only the queries run concurrently - the CSVs are written here one at a time, since queries for the
+        same metric name write to the same file.
+        """
+        for json_data in self.run_for_each_metric(self.request_metric_json):
+            self.csv_writer.dict_to_csv(json_data)
+
+    def run_for_each_metric(self, func: Callable[[str], Any]) -> Iterator:
+        """
+        This method calls a function for each metric concurrently.
+        :param func: The function to call with each metric
+        :return: The results of each call, in the same order as the metrics
+        """
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(16, len(self.metrics)))
+        ) as executor:
+            yield from executor.map(func, self.metrics)
+
+    def get_payload(self, metric: str) -> Dict:
+        """
+        This method builds the query parameters for a metric.
+        :param metric: The metric to query for
+        :return: The query parameters
+        """
+        return {
+            "query": metric,
+            "start": self.start,
+            "end": self.end,
+            "step": self.step,
+        }
+
+    def request_metric_to_json_file(self, metric: str):
+        """
+        This method runs the request and write function for a single metric.
+        :param metric: The metric to query for
+        """
+        response = self.http_request(self.get_payload(metric))
+        self.write_json_file(metric, response)
+
+    def request_metric_json(self, metric: str) -> Dict:
+        """
+        This method runs the request for a single metric and parses the response.
+        :param metric: The metric to query for
+        :return: The parsed JSON response
+        """
+        return self.http_request(self.get_payload(metric)).json()
 
     def http_request(self, metric) -> requests.Response:
         """
-        This method uses the request library's get function to send a HTTP GET request to the endpoint.
+        This method uses the shared session to send a HTTP GET request to the endpoint.
+        The response body is streamed, so it is not held in memory when written straight to a file.
         :param metric: The metric to query for
         :return: The HTTP response
         """
-        response = requests.get(self.endpoint, params=metric, timeout=300)
+        response = self.session.get(
+            self.endpoint, params=metric, timeout=300, stream=True
+        )
         assert response.status_code == 200, "The HTTP response did not return okay."
         return response
 
@@ -47,12 +120,13 @@ class RawData:
     def write_json_file(name: str, response: requests.Response):
         """
         This method writes the response data to a file.
+        The JSON body is written to disk in chunks as it is received, rather than parsed first.
         :param name: The metric name
         :param response: The HTTP response
         """
-        with open(f"{name}.csv", "w", encoding="utf-8") as json_file:
-            data = response.json()
-            json_file.write(str(data))
+        with open(f"{name}.csv", "wb") as json_file:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                json_file.write(chunk)
 
 
 class JsonToCSV:
@@ -62,6 +136,8 @@ class JsonToCSV:
 
     def __init__(self, metrics: List[str]):
         self.metrics = metrics
+        # Reverse DNS lookups are slow, so hostnames are cached by IP across all series and metrics
+        self._dns_cache: Dict[str, str] = {}
 
     def json_to_csv(self):
         """
@@ -91,9 +167,7 @@ class JsonToCSV:
         :param data: The data read from the file
         :return: Returns the data as a dictionary
         """
-        data = data.replace("'", '"')
-        json_data = json.loads(data)
-        return json_data
+        return json.loads(data)
 
     def dict_to_csv(self, json_data: Dict):
         """
@@ -117,41 +191,51 @@ class JsonToCSV:
                 "Unsupported query type: openstack or node currently supported."
             )
 
-    @staticmethod
-    def dict_to_csv_openstack(data: Dict):
+    def dict_to_csv_openstack(self, data: List[Dict]):
         """
         This method supports "openstack" queries.
         """
-        file_name = data[0]["metric"]["__name__"] + ".csv"
-        with open(file_name, "w", encoding="utf-8") as csv_file:
-            line = f'Date Time Hostname {data[0]["metric"]["__name__"]}\n'
-            csv_file.write(line)
-            for metric in data:
-                for i in range(len(metric["values"]) - 1):
-                    time = datetime.fromtimestamp(metric["values"][i][0])
-                    hostname = metric["metric"]["hostname"]
-                    value = metric["values"][i][1]
-                    line = f"{time} {hostname} {value}\n"
-                    csv_file.write(line)
+        self.write_csv(data, lambda metric: metric["metric"]["hostname"])
 
-    @staticmethod
-    def dict_to_csv_node(data: Dict):
+    def dict_to_csv_node(self, data: List[Dict]):
         """
         This method supports "node" queries.
         """
-        file_name = data[0]["metric"]["__name__"] + ".csv"
-        with open(file_name, "w", encoding="utf-8") as csv_file:
-            line = f'Date Time Hostname {data[0]["metric"]["__name__"]}\n'
-            csv_file.write(line)
+        self.write_csv(data, self.get_node_hostname)
+
+    def get_node_hostname(self, metric: Dict) -> str:
+        """
+        This method looks up the hostname of the instance a "node" series was scraped from.
+        :param metric: A series from the query results
+        :return: The hostname of the instance
+        """
+        ip = metric["metric"]["instance"].split(":")[0]
+        if ip not in self._dns_cache:
+            self._dns_cache[ip] = socket.gethostbyaddr(ip)[0]
+        return self._dns_cache[ip]
+
+    @staticmethod
+    def write_csv(data: List[Dict], get_hostname: Callable[[Dict], str]):
+        """
+        This method writes the data into a CSV file named after the metric.
+        The lines for each returned series are joined and written in one go rather than one write per value.
+        :param data: The query results from the Prometheus response
+        :param get_hostname: Function returning the hostname for a series in the results
+        """
+        metric_name = data[0]["metric"]["__name__"]
+        # A large buffer lets the writes for many small series go to disk together
+        with open(
+            f"{metric_name}.csv", "w", encoding="utf-8", buffering=1 << 20
+        ) as csv_file:
+            csv_file.write(f"Date Time Hostname {metric_name}\n")
             for metric in data:
-                for i in range(len(metric["values"]) - 1):
-                    time = datetime.fromtimestamp(metric["values"][i][0])
-                    hostname = socket.gethostbyaddr(
-                        metric["metric"]["instance"].split(":")[0]
-                    )[0]
-                    value = metric["values"][i][1]
-                    line = f"{time} {hostname} {value}\n"
-                    csv_file.write(line)
+                hostname = get_hostname(metric)
+                csv_file.write(
+                    "".join(
+                        f"{format_timestamp(timestamp)} {hostname} {value}\n"
+                        for timestamp, value in metric["values"]
+                    )
+                )
 
 
 if __name__ == "__main__":
@@ -166,5 +250,4 @@ if __name__ == "__main__":
     # Start and end time as posix seconds - this represents x date and y date
     START_TIME = "1710770960"
     END_TIME = "1710857376"
-    RawData(metrics_to_query, START_TIME, END_TIME, ENDPOINT).request_to_json_file()
-    JsonToCSV(metrics_to_query).json_to_csv()
+    RawData(metrics_to_query, START_TIME, END_TIME, ENDPOINT).request_to_csv()
@@ -1,6 +1,8 @@
-from unittest.mock import patch, NonCallableMock
+from datetime import datetime
+import threading
+from unittest.mock import patch, call, NonCallableMock
 import pytest
-from prom_query_to_csv import RawData, JsonToCSV
+from prom_query_to_csv import RawData, JsonToCSV, format_timestamp
 
 
 @pytest.fixture(name="instance_raw_data")
@@ -55,29 +57,97 @@ def test_request_to_json_file(
     assert not res
 
 
-@patch("prom_query_to_csv.requests.get")
+@patch("prom_query_to_csv.RawData.http_request")
+@patch("prom_query_to_csv.JsonToCSV.dict_to_csv")
+def test_request_to_csv(mock_dict_to_csv, mock_http_request, instance_raw_data):
+    """
+    This test makes sure each response is parsed and written as CSV without writing the JSON to a file.
+    """
+    res = instance_raw_data.request_to_csv()
+    mock_http_request.assert_any_call(
+        {"query": "metric1", "start": "123", "end": "456", "step": 60}
+    )
+    mock_http_request.assert_any_call(
+        {"query": "metric2", "start": "123", "end": "456", "step": 60}
+    )
+    assert mock_http_request.return_value.json.call_count == 2
+    mock_dict_to_csv.assert_called_with(
+        mock_http_request.return_value.json.return_value
+    )
+    assert mock_dict_to_csv.call_count == 2
+    assert not res
+
+
+@patch("prom_query_to_csv.RawData.http_request")
+@patch("prom_query_to_csv.JsonToCSV.dict_to_csv")
+def test_request_to_csv_writes_on_calling_thread(
+    mock_dict_to_csv, mock_http_request, instance_raw_data
+):
+    """
+    This test makes sure the CSVs are written one at a time on the calling thread, not in the worker threads.
+    Queries for the same metric name write to the same file, so writing them concurrently would corrupt it.
+    """
+    mock_http_request.return_value.json.side_effect = ["json1", "json2"]
+    writer_threads = []
+    mock_dict_to_csv.side_effect = lambda _: writer_threads.append(
+        threading.current_thread()
+    )
+    instance_raw_data.request_to_csv()
+    assert writer_threads == [threading.current_thread()] * 2
+    assert sorted(c.args[0] for c in mock_dict_to_csv.call_args_list) == [
+        "json1",
+        "json2",
+    ]
+
+
+@patch("prom_query_to_csv.RawData.http_request")
+@patch("prom_query_to_csv.RawData.write_json_file")
+def test_request_to_json_file_raises(
+    mock_write_json_file, mock_http_request, instance_raw_data
+):
+    """
+    This test makes sure an error querying a metric is not lost in the worker threads.
+    """
+    mock_http_request.side_effect = AssertionError
+    with pytest.raises(AssertionError):
+        instance_raw_data.request_to_json_file()
+    mock_write_json_file.assert_not_called()
+
+
+def test_raw_data_session(instance_raw_data):
+    """
+    This test ensures the shared session pools connections and retries failed connections.
+    """
+    for prefix in ("http://", "https://"):
+        adapter = instance_raw_data.session.get_adapter(prefix)
+        assert adapter.poolmanager.connection_pool_kw["maxsize"] == 16
+        assert adapter.max_retries.total == 3
+        assert adapter.max_retries.backoff_factor == 0.2
+
+
+@patch("prom_query_to_csv.requests.Session.get")
 def test_http_request_success(mock_get, instance_raw_data):
     """
-    This test ensures the requests.get method is called with the correct parameters.
+    This test ensures the session's get method is called with the correct parameters.
     """
     mock_get.return_value.status_code = 200
     res = instance_raw_data.http_request("mock_metric")
     mock_get.assert_called_once_with(
-        "http://mock.url.com", params="mock_metric", timeout=300
+        "http://mock.url.com", params="mock_metric", timeout=300, stream=True
     )
     assert res == mock_get.return_value
 
 
-@patch("prom_query_to_csv.requests.get")
+@patch("prom_query_to_csv.requests.Session.get")
 def test_http_request_fail(mock_get, instance_raw_data):
     """
-    This test ensures the requests.get method is called with the correct parameters.
+    This test ensures the session's get method is called with the correct parameters.
     """
     mock_get.return_value.status_code = 404
     with pytest.raises(AssertionError):
         res = instance_raw_data.http_request("mock_metric")
         mock_get.assert_called_once_with(
-            "http://mock.url.com", params="mock_metric", timeout=300
+            "http://mock.url.com", params="mock_metric", timeout=300, stream=True
         )
         assert res == mock_get.return_value
 
@@ -85,15 +155,15 @@ def test_http_request_fail(mock_get, instance_raw_data):
 @patch("prom_query_to_csv.open")
 def test_write_json_file(mock_open, instance_raw_data):
     """
-    This test ensures the open method is called and the data should be written.
+    This test ensures the open method is called and the response body should be written as it is streamed.
     """
     mock_response = NonCallableMock()
-    mock_response.json.return_value = "mock_data"
+    mock_response.iter_content.return_value = [b"mock_", b"data"]
     res = instance_raw_data.write_json_file("mock_name", mock_response)
-    mock_open.assert_called_once_with("mock_name.csv", "w", encoding="utf-8")
-    mock_response.json.assert_called_once()
-    mock_open.return_value.__enter__.return_value.write.assert_called_once_with(
-        "mock_data"
+    mock_open.assert_called_once_with("mock_name.csv", "wb")
+    mock_response.iter_content.assert_called_once_with(chunk_size=1 << 20)
+    mock_open.return_value.__enter__.return_value.write.assert_has_calls(
+        [call(b"mock_"), call(b"data")]
     )
     assert not res
 
@@ -131,9 +201,9 @@ def test_json_to_dict(instance_json_to_csv):
     """
     This test is ensuring that json loads reads the data in correctly
     """
-    mock_data = '{"mock_key":"mock_value"}'
+    mock_data = '{"mock_key":"mock_value\'s"}'
     res = instance_json_to_csv.json_to_dict(mock_data)
-    assert res == {"mock_key": "mock_value"}
+    assert res == {"mock_key": "mock_value's"}
 
 
 @patch("prom_query_to_csv.JsonToCSV.dict_to_csv_openstack")
@@ -166,3 +236,83 @@ def test_dict_to_csv_neither(instance_json_to_csv):
     with pytest.raises(Exception):
         res = instance_json_to_csv.dict_to_csv(mock_data)
         assert not res
+
+
+@pytest.fixture(name="mock_result")
+def mock_result_fixture():
+    """
+    This fixture returns a mock query result with one series.
+    """
+    return {
+        "__name__": "mock_metric",
+        "values": [[1710770960, "1"], [1710771020, "2"], [1710771080, "3"]],
+    }
+
+
+def test_write_csv_openstack(instance_json_to_csv, mock_result, tmp_path, monkeypatch):
+    """
+    This test ensures openstack query results are written to CSV with the hostname from the series.
+    """
+    monkeypatch.chdir(tmp_path)
+    mock_data = [
+        {"metric": {"__name__": "mock_metric", "hostname": "mock_host"}, **mock_result}
+    ]
+    res = instance_json_to_csv.dict_to_csv_openstack(mock_data)
+    assert not res
+    assert (tmp_path / "mock_metric.csv").read_text(encoding="utf-8") == (
+        "Date Time Hostname mock_metric\n"
+        f"{datetime.fromtimestamp(1710770960)} mock_host 1\n"
+        f"{datetime.fromtimestamp(1710771020)} mock_host 2\n"
+        f"{datetime.fromtimestamp(1710771080)} mock_host 3\n"
+    )
+
+
+@patch("prom_query_to_csv.socket.gethostbyaddr")
+def test_write_csv_node(
+    mock_gethostbyaddr, instance_json_to_csv, mock_result, tmp_path, monkeypatch
+):
+    """
+    This test ensures node query results are written to CSV with the hostname looked up from the instance.
+    """
+    monkeypatch.chdir(tmp_path)
+    mock_gethostbyaddr.return_value = ("mock_host", [], ["127.0.0.1"])
+    mock_data = [
+        {
+            "metric": {"__name__": "mock_metric", "instance": "127.0.0.1:9100"},
+            **mock_result,
+        }
+    ]
+    res = instance_json_to_csv.dict_to_csv_node(mock_data)
+    assert not res
+    mock_gethostbyaddr.assert_called_once_with("127.0.0.1")
+    assert (tmp_path / "mock_metric.csv").read_text(encoding="utf-8") == (
+        "Date Time Hostname mock_metric\n"
+        f"{datetime.fromtimestamp(1710770960)} mock_host 1\n"
+        f"{datetime.fromtimestamp(1710771020)} mock_host 2\n"
+        f"{datetime.fromtimestamp(1710771080)} mock_host 3\n"
+    )
+
+
+@patch("prom_query_to_csv.socket.gethostbyaddr")
+def test_get_node_hostname_cached(mock_gethostbyaddr, instance_json_to_csv):
+    """
+    This test ensures the hostname for an IP is only looked up once.
+    """
+    mock_gethostbyaddr.return_value = ("mock_host", [], ["127.0.0.1"])
+    mock_metric = {"metric": {"instance": "127.0.0.1:9100"}}
+    assert instance_json_to_csv.get_node_hostname(mock_metric) == "mock_host"
+    assert instance_json_to_csv.get_node_hostname(mock_metric) == "mock_host"
+    mock_gethostbyaddr.assert_called_once_with("127.0.0.1")
+
+
+@patch("prom_query_to_csv.datetime")
+def test_format_timestamp_cached(mock_datetime):
+    """
+    This test ensures each timestamp is only converted once.
+    """
+    format_timestamp.cache_clear()
+    mock_datetime.fromtimestamp.return_value = "mock_time"
+    assert format_timestamp(1710770960) == "mock_time"
+    assert format_timestamp(1710770960) == "mock_time"
+    mock_datetime.fromtimestamp.assert_called_once_with(1710770960)
+    format_timestamp.cache_clear()